@@ -0,0 +1,208 @@
+"""
+X-Accel-Redirect 下载卸载的集成检查
+
+用仓库中的 nginx.conf（替换端口，alias 替换为 BASE_PATH）启动 nginx，在其后启动
+DOWNLOAD_MODE=x-accel-redirect 的服务，另起一个 direct 模式的服务作为对照。上传一个文件后，
+对完整下载、各种 Range、If-None-Match、If-Range 和无法满足的 Range，比较经 nginx 卸载的响应与
+服务直接返回的 FileResponse：状态码、内容和 ETag、Last-Modified、Cache-Control、
+Content-Range、Content-Length、Content-Disposition 头需要一致（包括出现的次数）。
+
+    python accel_redirect_check.py --nginx /usr/sbin/nginx
+
+数据库和存储与服务相同（DB_*、BASE_PATH 环境变量），结束后删除上传的文件。有差异时退出码为 1。
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from src.config import FilesConfig
+
+HEADERS = [
+    "etag",
+    "last-modified",
+    "cache-control",
+    "content-range",
+    "content-length",
+    "content-disposition",
+]
+
+
+def render_config(path: Path, base_path: str, port: int, upstream_port: int) -> str:
+    """
+    nginx.conf of the repository with the ports and the storage of this run.
+    """
+    config = path.read_text()
+    replacements = [
+        (r"listen \d+;", f"listen 127.0.0.1:{port};"),
+        (r"server 127\.0\.0\.1:\d+;", f"server 127.0.0.1:{upstream_port};"),
+        (r"alias [^;\n]+;", f"alias {base_path}/;"),
+    ]
+    for pattern, replacement in replacements:
+        config, count = re.subn(pattern, replacement, config)
+        if count != 1:
+            raise ValueError(f"{pattern} not found once in {path}")
+
+    return config
+
+
+def start_api(port: int, download_mode: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        ["uvicorn", "src.app:app", "--host", "127.0.0.1", "--port", str(port)],
+        env={**os.environ, "DOWNLOAD_MODE": download_mode},
+    )
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def cases(size: int, etag: str, last_modified: str) -> dict[str, dict[str, str]]:
+    return {
+        "full": {},
+        "range start": {"range": "bytes=0-99"},
+        "range middle": {"range": f"bytes={size // 2}-{size // 2 + 4095}"},
+        "range open": {"range": f"bytes={size - 1000}-"},
+        "range suffix": {"range": "bytes=-100"},
+        "range past end": {"range": f"bytes={size - 10}-{size + 1000}"},
+        "range unsatisfiable": {"range": f"bytes={size}-"},
+        "if-none-match": {"if-none-match": etag},
+        "if-none-match stale": {"if-none-match": '"stale"'},
+        "if-modified-since": {"if-modified-since": last_modified},
+        "if-range etag": {"range": "bytes=0-99", "if-range": etag},
+        "if-range stale": {"range": "bytes=0-99", "if-range": '"stale"'},
+        "if-range date": {"range": "bytes=0-99", "if-range": last_modified},
+    }
+
+
+def compare(name: str, direct: httpx.Response, proxied: httpx.Response) -> bool:
+    differences = []
+    if direct.status_code != proxied.status_code:
+        differences.append(f"status {direct.status_code} != {proxied.status_code}")
+    # Every value, a header nginx adds next to the one of the service differs
+    for header in HEADERS:
+        if direct.headers.get_list(header) != proxied.headers.get_list(header):
+            differences.append(
+                f"{header} {direct.headers.get_list(header)!r} != "
+                f"{proxied.headers.get_list(header)!r}"
+            )
+    # Error pages of nginx and the service differ, only content is compared
+    if direct.status_code in (200, 206) and direct.content != proxied.content:
+        differences.append("content differs")
+
+    print(f"{'ok  ' if not differences else 'FAIL'} {name}")
+    for difference in differences:
+        print(f"     {difference}")
+
+    return not differences
+
+
+def check(direct_url: str, proxied_url: str, upstream_url: str, size: int) -> int:
+    content = os.urandom(size)
+    failed = 0
+
+    with httpx.Client(base_url=direct_url) as direct, httpx.Client(
+        base_url=proxied_url
+    ) as proxied:
+        response = direct.post(
+            "/v1/files", files=[("files", ("accel check.txt", content))]
+        )
+        response.raise_for_status()
+        file = response.json()[0]
+        url = f"/v1/files/{file['id']}/content"
+
+        try:
+            response = direct.get(url)
+            if response.content != content:
+                raise AssertionError("the direct download differs from the upload")
+
+            # Otherwise both sides would be served by FileResponse
+            offloaded = httpx.get(f"{upstream_url}{url}")
+            if "x-accel-redirect" not in offloaded.headers:
+                raise AssertionError("the upstream did not offload the download")
+            if "x-accel-redirect" in proxied.get(url).headers:
+                raise AssertionError("nginx did not follow X-Accel-Redirect")
+
+            for name, headers in cases(
+                size, response.headers["etag"], response.headers["last-modified"]
+            ).items():
+                failed += not compare(
+                    name,
+                    direct.get(url, headers=headers),
+                    proxied.get(url, headers=headers),
+                )
+        finally:
+            direct.delete(f"/v1/files/{file['id']}")
+
+    return failed
+
+
+def main(nginx: str, port: int, upstream_port: int, direct_port: int, size: int) -> int:
+    base_path = os.path.abspath(FilesConfig().base_path)
+    processes = []
+
+    with tempfile.TemporaryDirectory() as prefix:
+        config = Path(prefix) / "nginx.conf"
+        config.write_text(
+            render_config(
+                Path(__file__).with_name("nginx.conf"), base_path, port, upstream_port
+            )
+        )
+
+        try:
+            processes.append(start_api(upstream_port, "x-accel-redirect"))
+            processes.append(start_api(direct_port, "direct"))
+            processes.append(
+                subprocess.Popen(
+                    [nginx, "-p", prefix, "-c", str(config), "-g", "daemon off;"]
+                )
+            )
+            for url in [
+                f"http://127.0.0.1:{upstream_port}/healthz",
+                f"http://127.0.0.1:{direct_port}/healthz",
+                f"http://127.0.0.1:{port}/healthz",
+            ]:
+                wait_ready(url)
+
+            failed = check(
+                f"http://127.0.0.1:{direct_port}",
+                f"http://127.0.0.1:{port}",
+                f"http://127.0.0.1:{upstream_port}",
+                size,
+            )
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nginx", default="nginx")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--upstream-port", type=int, default=9001)
+    parser.add_argument("--direct-port", type=int, default=9002)
+    parser.add_argument("--size", type=int, default=3 * 1024 * 1024)
+    args = parser.parse_args()
+
+    sys.exit(
+        main(args.nginx, args.port, args.upstream_port, args.direct_port, args.size)
+    )
@@ -0,0 +1,155 @@
+"""
+Bases 客户端批量权限检查的自动化检查
+
+以不同的 BASES_STUB_BATCH 模式启动 bases_stub（BASES_STUB_ALLOW=even），检查 BasesClient 与
+PermissionService：
+
+- true: 一次批量请求得到按顺序的结果，不做逐个检查
+- 404、405、501: 回退为逐个检查，结果相同，重试间隔内不再请求批量接口
+- short: 批量响应的项数与请求不一致时抛出 BasesServiceNotAvailable，而不是返回错误的结果
+
+    python bases_client_check.py --port 9105
+
+有失败时退出码为 1。
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from uuid import UUID
+
+import httpx
+
+from src.v1.clients import api_config, close_http_clients
+from src.v1.clients.bases import BasesClient, PermissionCheck
+from src.v1.exceptions.services import BasesServiceNotAvailable
+from src.v1.schemas.files import AuthorizationContext
+from src.v1.services.permissions import PermissionService, permission_cache
+
+USER_ID = UUID(int=1)
+
+
+def start_stub(port: int, batch: str) -> subprocess.Popen:
+    process = subprocess.Popen(
+        ["uvicorn", "bases_stub:app", "--host", "127.0.0.1", "--port", str(port)],
+        env={**os.environ, "BASES_STUB_BATCH": batch, "BASES_STUB_ALLOW": "even"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats").raise_for_status()
+            return process
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise
+            time.sleep(0.2)
+
+
+def checks(count: int) -> list[PermissionCheck]:
+    # The stub allows the even attachment ids
+    return [
+        PermissionCheck(
+            principal_id=USER_ID, attachment_id=UUID(int=i), object_id=UUID(int=i)
+        )
+        for i in range(count)
+    ]
+
+
+def expected(count: int) -> list[bool]:
+    return [i % 2 == 0 for i in range(count)]
+
+
+async def check_batch(client: BasesClient, stats: str) -> list[str]:
+    failures = []
+    if await client.check_permissions_batch(USER_ID, checks(5)) != expected(5):
+        failures.append("wrong decisions")
+    counts = httpx.get(stats).json()
+    if counts["batch_check"] != 1 or counts["check"] != 0:
+        failures.append(f"not checked in one batch: {counts}")
+
+    return failures
+
+
+async def check_fallback(client: BasesClient, stats: str) -> list[str]:
+    failures = []
+    for _ in range(2):
+        if await client.check_permissions_batch(USER_ID, checks(5)) != expected(5):
+            failures.append("wrong decisions")
+    if not BasesClient._batch_unsupported_until > time.monotonic():
+        failures.append("the batch endpoint is not remembered as unsupported")
+    counts = httpx.get(stats).json()
+    if counts["check"] != 10:
+        failures.append(f"not checked one by one: {counts}")
+
+    return failures
+
+
+async def check_short(client: BasesClient, stats: str) -> list[str]:
+    failures = []
+    try:
+        await client.check_permissions_batch(USER_ID, checks(5))
+        failures.append("client: a short response was accepted")
+    except BasesServiceNotAvailable:
+        pass
+
+    # Through the service, where the decisions are matched back to the checks
+    api_config.bases_base_url = client.base_url
+    permission_cache.clear()
+    try:
+        await PermissionService().check_attachment_permissions(
+            user_id=USER_ID,
+            checks=[
+                (UUID(int=i), AuthorizationContext(attachment_id=UUID(int=i)))
+                for i in range(5)
+            ],
+        )
+        failures.append("service: a short response was accepted")
+    except BasesServiceNotAvailable:
+        pass
+    except Exception as e:
+        failures.append(f"service: {e!r} instead of BasesServiceNotAvailable")
+
+    return failures
+
+
+async def main(port: int) -> int:
+    modes = [
+        ("true", check_batch),
+        ("404", check_fallback),
+        ("405", check_fallback),
+        ("501", check_fallback),
+        ("short", check_short),
+    ]
+    failed = 0
+
+    for batch, check in modes:
+        process = start_stub(port, batch)
+        base_url = f"http://127.0.0.1:{port}"
+        BasesClient._batch_unsupported_until = 0.0
+        try:
+            failures = await check(BasesClient(base_url), f"{base_url}/stats")
+        finally:
+            await close_http_clients()
+            process.terminate()
+            process.wait()
+
+        failed += bool(failures)
+        print(f"{'ok  ' if not failures else 'FAIL'} BASES_STUB_BATCH={batch}")
+        for failure in failures:
+            print(f"     {failure}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9105)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.port)))
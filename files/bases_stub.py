@@ -0,0 +1,65 @@
+"""
+Bases 服务的本地替身，用于联调与压测附件权限检查
+
+    BASES_STUB_LATENCY_MS=5 uvicorn bases_stub:app --port 9005
+
+- BASES_STUB_ALLOW: all | none | even（attachment_id 为偶数时允许），默认 all
+- BASES_STUB_BATCH: true 时提供批量接口；false 或 404、405、501 时批量接口返回该状态码（false 为 404），
+  用于测试逐个检查的回退；short 时批量接口少返回一项，用于测试对错误响应的处理
+- BASES_STUB_LATENCY_MS: 每个请求的模拟延迟
+"""
+
+import asyncio
+import os
+from uuid import UUID
+
+from fastapi import FastAPI, Request, Response
+
+ALLOW = os.getenv("BASES_STUB_ALLOW", "all")
+BATCH = os.getenv("BASES_STUB_BATCH", "true").lower()
+LATENCY = int(os.getenv("BASES_STUB_LATENCY_MS", 0)) / 1000
+
+app = FastAPI()
+stats = {"check": 0, "batch_check": 0, "batch_items": 0}
+
+
+def allowed(attachment_id: str) -> bool:
+    match ALLOW:
+        case "all":
+            return True
+        case "even":
+            return UUID(attachment_id).int % 2 == 0
+        case _:
+            return False
+
+
+@app.get("/v1/permissions/check")
+async def check(attachment_id: str):
+    stats["check"] += 1
+    await asyncio.sleep(LATENCY)
+
+    return Response(status_code=200 if allowed(attachment_id) else 403)
+
+
+@app.post("/v1/permissions/batch-check")
+async def batch_check(request: Request):
+    if BATCH == "false":
+        return Response(status_code=404)
+    if BATCH.isdigit():
+        return Response(status_code=int(BATCH))
+
+    items = (await request.json())["items"]
+    stats["batch_check"] += 1
+    stats["batch_items"] += len(items)
+    await asyncio.sleep(LATENCY)
+
+    decisions = [{"allowed": allowed(item["attachment_id"])} for item in items]
+    if BATCH == "short":
+        decisions = decisions[:-1]
+
+    return {"items": decisions}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
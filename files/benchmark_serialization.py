@@ -0,0 +1,154 @@
+"""
+文件列表序列化基准
+
+在独立的 schema 中为一个用户写入文件，对比列表接口的两种读取路径：
+
+    orm: 加载 File ORM 对象，FileListResponse.model_validate，jsonable_encoder，JSONResponse
+    rows: 用 SQLAlchemy Core 查询普通行，file_row_to_json 直接生成 JSON，JSONResponse
+
+两者的响应字节必须完全一致，不一致时退出码为 1。
+
+    python benchmark_serialization.py --rows 5000 --page-size 500 --iterations 50
+
+数据库连接与服务相同（DB_* 环境变量），结束后删除该 schema。
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import DBConfig, DBPoolConfig
+from src.db import get_async_engine
+from src.models import Base
+from src.v1.repositories.files import FileRepository
+from src.v1.schemas.files import FileListResponse, file_row_to_json
+
+SCHEMA = "benchmark_serialization"
+USER_ID = UUID(int=1)
+
+
+async def seed(connection, rows: int):
+    await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    await connection.run_sync(Base.metadata.create_all)
+    # extra holds floats, unicode and nesting, the cases where encoders differ
+    await connection.execute(
+        text(f"""
+            INSERT INTO {SCHEMA}.files
+                (id, user_id, filename, path, size_bytes, extension, extra,
+                 sha256, created_at, updated_at, deleted_at)
+            SELECT
+                gen_random_uuid(),
+                :user_id,
+                '文件-' || i || '.txt',
+                '/data/' || i || '.txt',
+                i % 4096,
+                'txt',
+                CASE WHEN i % 5 <> 0 THEN jsonb_build_object(
+                    'n', i,
+                    'ratio', i / 7.0,
+                    'name', '名称 "' || i || '"',
+                    'tags', jsonb_build_array('a', i % 3, i % 2 = 0, NULL)
+                ) END,
+                CASE WHEN i % 2 = 0 THEN md5(i::text) || md5(i::text) END,
+                now() - (i || ' seconds')::interval * 150,
+                now() - (i || ' seconds')::interval * 100,
+                CASE WHEN i % 10 = 0 THEN now() END
+            FROM generate_series(1, :rows) AS i
+            """),
+        {"rows": rows, "user_id": USER_ID},
+    )
+    await connection.execute(text(f"ANALYZE {SCHEMA}.files"))
+
+
+async def orm(session: AsyncSession, page: int, page_size: int) -> tuple[bytes, float]:
+    paginated = await FileRepository(session).get_by_user_id_page_paginated(
+        USER_ID, page=page, page_size=page_size
+    )
+    start = time.perf_counter()
+    response = JSONResponse(
+        jsonable_encoder(FileListResponse.model_validate(paginated))
+    )
+
+    return response.body, time.perf_counter() - start
+
+
+async def rows(session: AsyncSession, page: int, page_size: int) -> tuple[bytes, float]:
+    paginated = await FileRepository(session).get_by_user_id_page_paginated(
+        USER_ID, page=page, page_size=page_size, rows=True
+    )
+    start = time.perf_counter()
+    response = JSONResponse(
+        {
+            "total": paginated.total,
+            "pages": paginated.pages,
+            "page": paginated.page,
+            "page_size": paginated.page_size,
+            "items": [file_row_to_json(row) for row in paginated.items],
+            "next_cursor": paginated.next_cursor,
+        }
+    )
+
+    return response.body, time.perf_counter() - start
+
+
+async def main(rows_count: int, page_size: int, iterations: int) -> int:
+    engine = get_async_engine(DBConfig(), DBPoolConfig()).execution_options(
+        schema_translate_map={None: SCHEMA}
+    )
+    pages = max(1, rows_count // page_size)
+    timings = {"orm": ([], []), "rows": ([], [])}
+    mismatches = 0
+
+    try:
+        async with engine.begin() as connection:
+            await seed(connection, rows_count)
+
+        for i in range(iterations):
+            page = i % pages + 1
+            bodies = {}
+            # A session per call, so the ORM objects are not reused from the
+            # identity map of a previous iteration
+            for name, read in [("orm", orm), ("rows", rows)]:
+                async with AsyncSession(engine) as session:
+                    start = time.perf_counter()
+                    bodies[name], serialize = await read(session, page, page_size)
+                    timings[name][0].append(time.perf_counter() - start)
+                    timings[name][1].append(serialize)
+
+            if bodies["orm"] != bodies["rows"]:
+                mismatches += 1
+                print(f"FAIL page {page}: the responses differ")
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    print(f"{iterations} pages of {page_size} files, median ms")
+    print(f"{'':6}{'total':>10}{'serialize':>12}")
+    for name, (total, serialize) in timings.items():
+        print(
+            f"{name:6}{statistics.median(total) * 1000:10.2f}"
+            f"{statistics.median(serialize) * 1000:12.2f}"
+        )
+    print("responses identical" if not mismatches else f"{mismatches} mismatches")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.rows, args.page_size, args.iterations)))
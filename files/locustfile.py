@@ -1,3 +1,13 @@
+"""
+压测脚本
+
+    locust -f locustfile.py --headless -u 100 -r 20 -t 60s \
+        --host http://127.0.0.1:9001 --csv result
+
+对比两个版本（如同步与异步数据库路径）时，使用相同的参数、数据库和数据量分别运行，
+比较 result_stats.csv 中 Aggregated 行的 Requests/s 和 95%/99% 延迟。
+"""
+
 from locust import HttpUser, task, between
 import os
 import uuid
@@ -49,11 +59,11 @@ class FileServiceUser(HttpUser):
         if self.file_id:
             self.client.post(f"/v1/files/{self.file_id}/soft-delete", headers=self.headers)
 
-    # @task(1)
-    # def batch_get_files(self):
-    #     if self.file_id:
-    #         data = [{"file_id": self.file_id}]
-    #         self.client.post("/v1/files/batch-get", json=data, headers=self.headers)
+    @task(1)
+    def batch_get_files(self):
+        if self.file_id:
+            data = {"items": [{"file_id": self.file_id}]}
+            self.client.post("/v1/files/batch-get", json=data, headers=self.headers)
 
     # @task(1)
     # def batch_details(self):
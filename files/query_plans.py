@@ -0,0 +1,180 @@
+"""
+查询计划回归检查
+
+在独立的 schema 中按 models 建表和索引，写入大量数据并 ANALYZE，然后执行
+FileRepository 的各个查询，对捕获到的 SQL 执行 EXPLAIN，确认 files 表没有被顺序扫描。
+
+    python query_plans.py --rows 200000 --users 1000
+
+数据库连接与服务相同（DB_* 环境变量），结束后删除该 schema。发现顺序扫描时退出码为 1。
+"""
+
+import argparse
+import asyncio
+import sys
+from uuid import UUID
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import DBConfig, DBPoolConfig
+from src.db import get_async_engine
+from src.models import Base
+from src.v1.repositories.files import FileRepository
+
+SCHEMA = "query_plans"
+
+
+def user_id(n: int) -> UUID:
+    return UUID(int=n)
+
+
+async def seed(connection, rows: int, users: int):
+    await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    await connection.run_sync(Base.metadata.create_all)
+    # Every 10th file is soft deleted, timestamps spread over a year
+    await connection.execute(
+        text(f"""
+            INSERT INTO {SCHEMA}.files
+                (id, user_id, filename, path, size_bytes, extension,
+                 created_at, updated_at, deleted_at)
+            SELECT
+                gen_random_uuid(),
+                lpad(to_hex(i % :users), 32, '0')::uuid,
+                'file-' || i || '.txt',
+                '/data/' || i || '.txt',
+                i % 4096,
+                'txt',
+                now() - (i || ' seconds')::interval * 150,
+                now() - (i || ' seconds')::interval * 100,
+                CASE WHEN i % 10 = 0 THEN now() END
+            FROM generate_series(1, :rows) AS i
+            """),
+        {"rows": rows, "users": users},
+    )
+    await connection.execute(text(f"ANALYZE {SCHEMA}.files"))
+
+
+async def capture(session: AsyncSession, users: int) -> list[tuple[str, str, dict]]:
+    """
+    Run the repository queries and capture the emitted SQL.
+    """
+    repo = FileRepository(session)
+    connection = await session.connection()
+    uid = user_id(users // 2 + 1)
+    ids = list(
+        await session.scalars(
+            text(
+                f"SELECT id FROM {SCHEMA}.files WHERE user_id = :u AND deleted_at IS NULL LIMIT 20"
+            ),
+            {"u": uid},
+        )
+    )
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if not statement.startswith("EXPLAIN"):
+            statements.append((current, statement, parameters))
+
+    event.listen(
+        connection.sync_connection, "before_cursor_execute", before_cursor_execute
+    )
+
+    async def paginate(order_by: str, order: str, active: bool):
+        # A deep offset page, then the keyset page after it
+        page = await repo.get_by_user_id_page_paginated(
+            uid, page=3, order_by=order_by, order=order, include_soft_deleted=not active
+        )
+        await repo.get_by_user_id_page_paginated(
+            uid,
+            order_by=order_by,
+            order=order,
+            include_soft_deleted=not active,
+            cursor=page.next_cursor,
+            total="none",
+        )
+
+    calls = {
+        "get": lambda: repo.get(ids[0]),
+        "get (active)": lambda: repo.get(ids[0], include_soft_deleted=False),
+        "get_by_user_id": lambda: repo.get_by_user_id(uid),
+        "get_by_user_id (active)": lambda: repo.get_by_user_id(
+            uid, include_soft_deleted=False
+        ),
+        "get_by_ids": lambda: repo.get_by_ids(ids),
+        "get_by_ids_and_user_id": lambda: repo.get_by_ids_and_user_id(ids, uid),
+    }
+    for order_by in ["updated_at", "created_at"]:
+        for order in ["desc", "asc"]:
+            for active in [False, True]:
+                name = f"page {order_by} {order}{' (active)' if active else ''}"
+                calls[name] = lambda o=order_by, d=order, a=active: paginate(o, d, a)
+
+    for current, call in calls.items():
+        await call()
+
+    event.remove(
+        connection.sync_connection, "before_cursor_execute", before_cursor_execute
+    )
+
+    return statements
+
+
+def seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") == "files":
+        found.append(plan["Node Type"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+
+    return found
+
+
+def scans(plan: dict) -> list[str]:
+    found = []
+    if "Relation Name" in plan or "Index Name" in plan:
+        found.append(f"{plan['Node Type']} {plan.get('Index Name', '')}".strip())
+    for child in plan.get("Plans", []):
+        found.extend(scans(child))
+
+    return found
+
+
+async def main(rows: int, users: int) -> int:
+    engine = get_async_engine(DBConfig(), DBPoolConfig()).execution_options(
+        schema_translate_map={None: SCHEMA}
+    )
+    failed = 0
+
+    try:
+        async with engine.begin() as connection:
+            await seed(connection, rows, users)
+
+        async with AsyncSession(engine) as session:
+            statements = await capture(session, users)
+            connection = await session.connection()
+
+            for name, statement, parameters in statements:
+                result = await connection.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}", parameters
+                )
+                plan = result.scalar()[0]["Plan"]
+                ok = not seq_scans(plan)
+                failed += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name}: {', '.join(scans(plan))}")
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.rows, args.users)))
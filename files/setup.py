@@ -43,7 +43,7 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn",
-        "sqlalchemy",
+        "sqlalchemy[asyncio]",
         "pydantic",
         "python-jose[cryptography]",
         "passlib[bcrypt]",
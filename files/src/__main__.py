@@ -1,6 +1,8 @@
 import argparse
+import asyncio
 import subprocess
 from pathlib import Path
+from uuid import UUID
 
 
 from . import __title__, __version__
@@ -28,6 +30,123 @@ def main():
 
     init_parser = subparsers.add_parser("init", help="Initialize the storage")
 
+    gc_parser = subparsers.add_parser(
+        "gc", help="Remove expired upload sessions and their chunks"
+    )
+
+    relayout_parser = subparsers.add_parser(
+        "relayout", help="Move the stored files to the configured STORAGE_LAYOUT"
+    )
+    relayout_parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Files linked in parallel (default: %(default)s)",
+    )
+    relayout_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Files per database batch (default: %(default)s)",
+    )
+    relayout_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Only count the files to move (default: %(default)s)",
+    )
+
+    import_parser = subparsers.add_parser(
+        "import", help="Register the files of a local directory tree for a user"
+    )
+    import_parser.add_argument("directory", type=Path, help="Directory to import")
+    import_parser.add_argument(
+        "--user", type=UUID, required=True, help="Owner of the imported files"
+    )
+    import_parser.add_argument(
+        "--mode",
+        choices=["register", "move", "hardlink", "reflink"],
+        default="register",
+        help="Register the files in place or ingest them into the storage "
+        "(default: %(default)s)",
+    )
+    import_parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Directories scanned in parallel (default: %(default)s)",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Files per COPY batch (default: %(default)s)",
+    )
+    import_parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="File of the imported directories, to resume an interrupted import "
+        "(default: import-<user>.checkpoint)",
+    )
+
+    reconcile_parser = subparsers.add_parser(
+        "reconcile",
+        help="Find the stored files without a row and the rows without a file",
+    )
+    reconcile_parser.add_argument(
+        "--repair",
+        action="store_true",
+        default=False,
+        help="Remove the orphan files and soft delete the rows of missing files "
+        "(default: %(default)s)",
+    )
+    reconcile_parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Directories listed in parallel (default: %(default)s)",
+    )
+    reconcile_parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Max filesystem operations per second, 0 is unlimited "
+        "(default: %(default)s)",
+    )
+    reconcile_parser.add_argument(
+        "--grace",
+        type=float,
+        default=3600,
+        help="Seconds a file must be unmodified to be an orphan "
+        "(default: %(default)s)",
+    )
+
+    purge_parser = subparsers.add_parser(
+        "purge", help="Delete the files soft deleted more than RETENTION_DAYS ago"
+    )
+    purge_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Files per database batch (default: %(default)s)",
+    )
+    purge_parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Max file removals enqueued per second, 0 is unlimited "
+        "(default: %(default)s)",
+    )
+
+    worker_parser = subparsers.add_parser("worker", help="Run the background jobs")
+    worker_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Jobs run concurrently (default: %(default)s)",
+    )
+
     args = parser.parse_args()
 
     match args.command:
@@ -37,6 +156,30 @@ def main():
             _init_storage()
         case "migrate":
             _migrate()
+        case "gc":
+            asyncio.run(_collect_garbage())
+        case "relayout":
+            asyncio.run(_relayout(args.workers, args.batch_size, args.dry_run))
+        case "import":
+            asyncio.run(
+                _import(
+                    args.directory,
+                    args.user,
+                    args.mode,
+                    args.workers,
+                    args.batch_size,
+                    args.checkpoint or Path(f"import-{args.user}.checkpoint"),
+                )
+            )
+        case "reconcile":
+            asyncio.run(_reconcile(args.repair, args.workers, args.rate, args.grace))
+        case "purge":
+            asyncio.run(_purge(args.batch_size, args.rate))
+        case "worker":
+            try:
+                asyncio.run(_work(args.concurrency))
+            except KeyboardInterrupt:
+                pass
         case _:
             parser.print_help()
             exit(1)
@@ -81,5 +224,172 @@ def _init_storage():
     base_path.mkdir(parents=True, exist_ok=True)
 
 
+async def _collect_garbage():
+    """Remove expired upload sessions, run it periodically (e.g. cron)."""
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.repositories.upload_sessions import UploadSessionRepository
+    from .v1.services.files import FileService
+    from .v1.services.permissions import PermissionService
+    from .v1.services.storage import LocalStorageService
+    from .v1.services.upload_sessions import UploadSessionService
+
+    config = FilesConfig()
+    storage = LocalStorageService(config=config)
+    svc = UploadSessionService(
+        config=config,
+        repo=UploadSessionRepository(),
+        storage=storage,
+        file_service=FileService(
+            config=config,
+            repo=FileRepository(),
+            storage=storage,
+            permission_service=PermissionService(),
+        ),
+    )
+
+    try:
+        expired, orphans = await svc.collect_garbage()
+        print(
+            f"Removed {expired} expired upload sessions, {orphans} orphan directories"
+        )
+    finally:
+        await async_engine.dispose()
+
+
+async def _relayout(workers: int, batch_size: int, dry_run: bool):
+    """Move the stored files to the configured layout, safe to run again."""
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.services.relayout import RelayoutService
+    from .v1.services.storage import LocalStorageService
+
+    svc = RelayoutService(
+        repo=FileRepository(),
+        storage=LocalStorageService(config=FilesConfig()),
+        workers=workers,
+        batch_size=batch_size,
+    )
+
+    try:
+        stats = await svc.run(dry_run=dry_run)
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+    finally:
+        await async_engine.dispose()
+
+
+async def _import(
+    directory: Path,
+    user_id: UUID,
+    mode: str,
+    workers: int,
+    batch_size: int,
+    checkpoint: Path,
+):
+    """Register a directory tree, run it again with the same checkpoint to resume."""
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.services.importer import ImportService
+    from .v1.services.storage import LocalStorageService
+
+    config = FilesConfig()
+    svc = ImportService(
+        config=config,
+        repo=FileRepository(),
+        storage=LocalStorageService(config=config),
+        user_id=user_id,
+        checkpoint=checkpoint,
+        mode=mode,
+        workers=workers,
+        batch_size=batch_size,
+    )
+
+    try:
+        stats = await svc.run(directory)
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+    finally:
+        await async_engine.dispose()
+
+
+async def _reconcile(repair: bool, workers: int, rate: float, grace: float):
+    """
+    Diff the storage and the database, run it from the working directory of the
+    service if BASE_PATH is relative.
+    """
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.services.reconcile import ReconcileService
+    from .v1.services.storage import LocalStorageService
+
+    svc = ReconcileService(
+        repo=FileRepository(),
+        repair_repo=FileRepository(),
+        storage=LocalStorageService(config=FilesConfig()),
+        workers=workers,
+        rate=rate,
+        grace=grace,
+    )
+
+    try:
+        stats = await svc.run(repair=repair)
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+    finally:
+        await async_engine.dispose()
+
+
+async def _purge(batch_size: int, rate: float):
+    """Purge the expired soft deleted files, run it periodically (e.g. cron)."""
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.services.retention import RetentionService
+
+    svc = RetentionService(
+        config=FilesConfig(),
+        repo=FileRepository(),
+        batch_size=batch_size,
+        rate=rate,
+    )
+
+    try:
+        stats = await svc.run()
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+    finally:
+        await async_engine.dispose()
+
+
+async def _work(concurrency: int):
+    """Run the queued jobs until interrupted, several workers can run at once."""
+    from .config import JobConfig
+    from .db import async_engine
+    from .v1.repositories.files import FileRepository
+    from .v1.repositories.jobs import JobRepository
+    from .v1.services.files import DELETE_CONTENT_JOB, FileService
+    from .v1.services.jobs import JobService
+    from .v1.services.permissions import PermissionService
+    from .v1.services.storage import LocalStorageService
+
+    config = FilesConfig()
+    file_service = FileService(
+        config=config,
+        repo=FileRepository(),
+        storage=LocalStorageService(config=config),
+        permission_service=PermissionService(),
+    )
+    handlers = {DELETE_CONTENT_JOB: file_service.delete_content}
+    services = [
+        JobService(config=JobConfig(), repo=JobRepository(), handlers=handlers)
+        for _ in range(concurrency)
+    ]
+
+    try:
+        await asyncio.gather(*(svc.run() for svc in services))
+    finally:
+        stats = {
+            key: sum(svc.stats[key] for svc in services) for key in services[0].stats
+        }
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+        await async_engine.dispose()
+
+
 if __name__ == "__main__":
     main()
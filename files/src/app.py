@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
 from fastapi import FastAPI, Request
@@ -5,11 +7,32 @@ from fastapi.responses import JSONResponse
 
 
 from src import __title__, __version__
+from src.config import DBConfig
+from src.db import async_engine, get_conninfo
 from src.v1.api import router as v1_router
+from src.v1.clients import close_http_clients
+from src.v1.services.executor import io_executors
+from src.v1.services.file_cache import file_cache
 from src.v1.schemas.errors import Error
 from src.v1.exceptions import ErrorRegistry
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = None
+    if file_cache.config.max_size > 0:
+        listener = asyncio.create_task(file_cache.listen(get_conninfo(DBConfig())))
+
+    yield
+
+    if listener is not None:
+        listener.cancel()
+    await close_http_clients()
+    await async_engine.dispose()
+    io_executors.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -8,8 +8,74 @@ class APIConfig:
         "EXTERNAL_ADDRESS_HEADER", "X-Envoy-External-Address"
     )
     users_base_url = os.getenv("USERS_BASE_URL", "http://localhost:9004")
+    users_timeout: float = float(os.getenv("USERS_TIMEOUT", 5))
+    users_max_connections: int = int(os.getenv("USERS_MAX_CONNECTIONS", 100))
+    users_max_keepalive_connections: int = int(
+        os.getenv("USERS_MAX_KEEPALIVE_CONNECTIONS", 20)
+    )
+    users_keepalive_expiry: float = float(os.getenv("USERS_KEEPALIVE_EXPIRY", 30))
     user_id_header: str = os.getenv("USER_ID_HEADER", "X-User-ID")
     bases_base_url = os.getenv("BASES_BASE_URL", "http://localhost:9005")
+    bases_timeout: float = float(os.getenv("BASES_TIMEOUT", 5))
+    bases_max_connections: int = int(os.getenv("BASES_MAX_CONNECTIONS", 100))
+    bases_max_keepalive_connections: int = int(
+        os.getenv("BASES_MAX_KEEPALIVE_CONNECTIONS", 20)
+    )
+    bases_keepalive_expiry: float = float(os.getenv("BASES_KEEPALIVE_EXPIRY", 30))
+    # Requires the h2 package (httpx[http2])
+    bases_http2: bool = os.getenv("BASES_HTTP2", "false").lower() == "true"
+    # Concurrent single checks when the Bases service can not check in batch
+    bases_check_concurrency: int = int(os.getenv("BASES_CHECK_CONCURRENCY", 10))
+
+
+@dataclass
+class PermissionCacheConfig:
+    """
+    Cache of the Bases attachment permission decisions, per worker.
+    """
+
+    max_size: int = int(os.getenv("PERMISSION_CACHE_MAX_SIZE", 10000))
+    allow_ttl: float = float(os.getenv("PERMISSION_CACHE_ALLOW_TTL", 60))
+    deny_ttl: float = float(os.getenv("PERMISSION_CACHE_DENY_TTL", 10))
+
+
+@dataclass
+class TokenCacheConfig:
+    """
+    Cache of the tokens validated by the Users service, per worker. Keep the TTL
+    short, a revoked token is accepted until its entry expires.
+    """
+
+    max_size: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000))
+    ttl: float = float(os.getenv("TOKEN_CACHE_TTL", 60))
+    invalid_ttl: float = float(os.getenv("TOKEN_CACHE_INVALID_TTL", 5))
+
+
+@dataclass
+class FileCacheConfig:
+    """
+    Cache of the file metadata by id, per worker. Entries are invalidated by the
+    notifications of the database on every change, the TTLs only bound the
+    memory. A max size of 0 disables the cache.
+    """
+
+    max_size: int = int(os.getenv("FILE_CACHE_MAX_SIZE", 10000))
+    ttl: float = float(os.getenv("FILE_CACHE_TTL", 600))
+    missing_ttl: float = float(os.getenv("FILE_CACHE_MISSING_TTL", 10))
+    reconnect_delay: float = float(os.getenv("FILE_CACHE_RECONNECT_DELAY", 5))
+
+
+@dataclass
+class JobConfig:
+    """
+    Background jobs run by `python -m src worker`. A failed job is retried after
+    backoff * 2^(attempts - 1) seconds, up to max_backoff.
+    """
+
+    max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", 10))
+    backoff: float = float(os.getenv("JOB_BACKOFF", 5))
+    max_backoff: float = float(os.getenv("JOB_MAX_BACKOFF", 3600))
+    poll_interval: float = float(os.getenv("JOB_POLL_INTERVAL", 1))
 
 
 @dataclass
@@ -59,3 +125,90 @@ class FilesConfig:
         Max file size in bytes, default 100MB
         """
         return int(os.getenv("MAX_FILE_SIZE_MB", 100)) * 1024 * 1024
+
+    @property
+    def max_request_size(self) -> int:
+        """
+        Max size of an upload request in bytes, default 1GB
+        """
+        return int(os.getenv("MAX_REQUEST_SIZE_MB", 1024)) * 1024 * 1024
+
+    @property
+    def dedup(self) -> bool:
+        """
+        Store identical uploads once as content addressed blobs
+        """
+        return os.getenv("STORAGE_DEDUP", "false").lower() == "true"
+
+    @property
+    def layout(self) -> str:
+        """
+        "flat" stores the files of a user in one directory, "sharded" fans them
+        out by the leading hex digits of their uuid (<user_id>/ab/cd/<uuid>)
+        """
+        return os.getenv("STORAGE_LAYOUT", "flat").lower()
+
+    @property
+    def io_workers(self) -> int:
+        """
+        Threads running the blocking storage calls of a volume
+        """
+        return int(os.getenv("STORAGE_IO_WORKERS", 16))
+
+    @property
+    def io_max_queue(self) -> int:
+        """
+        Storage calls waiting for a thread of a volume before new ones are
+        rejected with 503
+        """
+        return int(os.getenv("STORAGE_IO_MAX_QUEUE", 256))
+
+    @property
+    def io_volumes(self) -> dict[str, int]:
+        """
+        Mount points with their own threads, e.g. "/mnt/hdd:4,/mnt/nvme:32".
+        Paths on no listed volume share the default threads.
+        """
+        volumes = {}
+        for volume in os.getenv("STORAGE_VOLUMES", "").split(","):
+            if volume.strip():
+                path, _, workers = volume.strip().rpartition(":")
+                volumes[path] = int(workers)
+
+        return volumes
+
+    @property
+    def upload_chunk_size(self) -> int:
+        """
+        Chunk size of upload sessions in bytes, default 8MB
+        """
+        return int(os.getenv("UPLOAD_CHUNK_SIZE_MB", 8)) * 1024 * 1024
+
+    @property
+    def upload_session_ttl(self) -> int:
+        """
+        Seconds before an unfinished upload session is collected, default 24 hours
+        """
+        return int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24)) * 3600
+
+    @property
+    def retention_days(self) -> int:
+        """
+        Days a soft deleted file is kept before it is purged, default 30
+        """
+        return int(os.getenv("RETENTION_DAYS", 30))
+
+    @property
+    def download_mode(self) -> str:
+        """
+        How file content is sent: "direct" by the worker, or offloaded to the proxy
+        with "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd)
+        """
+        return os.getenv("DOWNLOAD_MODE", "direct").lower()
+
+    @property
+    def download_accel_prefix(self) -> str:
+        """
+        Internal nginx location serving base_path in x-accel-redirect mode
+        """
+        return os.getenv("DOWNLOAD_ACCEL_PREFIX", "/protected-files/")
@@ -1,4 +1,6 @@
+from psycopg.conninfo import make_conninfo
 from sqlalchemy import create_engine, Engine, URL
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 
 from .config import DBConfig, DBPoolConfig
 
@@ -15,6 +17,21 @@ def get_url(config: DBConfig) -> str:
     ).render_as_string(hide_password=False)
 
 
+def get_conninfo(config: DBConfig) -> str:
+    """
+    Connection string of a plain psycopg connection, e.g. to LISTEN. Empty values
+    are left to the libpq defaults, like in the URL.
+    """
+    return make_conninfo(
+        host=config.host or None,
+        port=config.port,
+        user=config.user,
+        password=config.password or None,
+        dbname=config.name,
+        sslmode="require" if config.ssl else "disable",
+    )
+
+
 def get_engine(
     config: DBConfig,
     pool_config: DBPoolConfig,
@@ -30,5 +47,27 @@ def get_engine(
     )
 
 
+def get_async_engine(
+    config: DBConfig,
+    pool_config: DBPoolConfig,
+) -> AsyncEngine:
+    """
+    Async engine used by the API, psycopg 3 provides the async driver itself.
+    """
+    url = get_url(config)
+    return create_async_engine(
+        url,
+        pool_size=pool_config.max_size,
+        max_overflow=pool_config.max_overflow,
+        pool_timeout=pool_config.timeout,
+        pool_recycle=pool_config.recycle,
+        pool_pre_ping=pool_config.pre_ping,
+    )
+
+
 url = get_url(DBConfig())
 engine = get_engine(DBConfig(), DBPoolConfig())
+async_engine = get_async_engine(DBConfig(), DBPoolConfig())
+# Objects are used after commit (e.g. for the response), there is no implicit IO
+# in async mode, so they must not be expired on commit
+async_session = async_sessionmaker(async_engine, expire_on_commit=False)
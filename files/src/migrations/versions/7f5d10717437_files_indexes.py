@@ -0,0 +1,67 @@
+"""files indexes
+
+Revision ID: 7f5d10717437
+Revises: dd9073374d41
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7f5d10717437"
+down_revision: Union[str, None] = "dd9073374d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, columns, where), id completes the keyset of the cursor pagination.
+# Lookups by `id IN (...)` with `user_id` are served by the primary key.
+INDEXES = [
+    ("ix_files_user_id_updated_at", ["user_id", "updated_at", "id"], None),
+    ("ix_files_user_id_created_at", ["user_id", "created_at", "id"], None),
+    (
+        "ix_files_user_id_updated_at_active",
+        ["user_id", "updated_at", "id"],
+        "deleted_at IS NULL",
+    ),
+    (
+        "ix_files_user_id_created_at_active",
+        ["user_id", "created_at", "id"],
+        "deleted_at IS NULL",
+    ),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY does not lock writes but can not run in a
+    # transaction. A failed concurrent build leaves an invalid index behind, drop
+    # it first so the migration can simply be run again.
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.drop_index(
+                name,
+                table_name="files",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+            op.create_index(
+                name,
+                "files",
+                columns,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name="files",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
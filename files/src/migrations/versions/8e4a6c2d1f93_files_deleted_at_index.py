@@ -0,0 +1,47 @@
+"""files deleted_at index
+
+Revision ID: 8e4a6c2d1f93
+Revises: 5c1d7e9b2a48
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8e4a6c2d1f93"
+down_revision: Union[str, None] = "5c1d7e9b2a48"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Soft deleted files in deletion order, for the retention purge. Built
+    # concurrently like the other files indexes, see 7f5d10717437.
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_files_deleted_at",
+            table_name="files",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_files_deleted_at",
+            "files",
+            ["deleted_at"],
+            postgresql_concurrently=True,
+            postgresql_where=sa.text("deleted_at IS NOT NULL"),
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_files_deleted_at",
+            table_name="files",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,56 @@
+"""jsonb_merge_patch
+
+Revision ID: c2e8b4f6a153
+Revises: a91f3d5b7c20
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c2e8b4f6a153"
+down_revision: Union[str, None] = "a91f3d5b7c20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # RFC 7396 JSON merge patch: objects are merged recursively, a null member
+    # removes the key, anything else replaces the target. `jsonb ||` only merges
+    # the top level and keeps the nulls.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION jsonb_merge_patch(target jsonb, patch jsonb)
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        IMMUTABLE
+        AS $$
+        BEGIN
+            IF jsonb_typeof(patch) IS DISTINCT FROM 'object' THEN
+                RETURN patch;
+            END IF;
+            IF jsonb_typeof(target) IS DISTINCT FROM 'object' THEN
+                target := '{}';
+            END IF;
+
+            RETURN (
+                SELECT coalesce(jsonb_object_agg(key, value), '{}')
+                FROM (
+                    SELECT t.key, t.value
+                    FROM jsonb_each(target) AS t
+                    WHERE NOT patch ? t.key
+                    UNION ALL
+                    SELECT p.key, jsonb_merge_patch(target -> p.key, p.value)
+                    FROM jsonb_each(patch) AS p
+                    WHERE jsonb_typeof(p.value) <> 'null'
+                ) AS merged
+            );
+        END;
+        $$
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION IF EXISTS jsonb_merge_patch(jsonb, jsonb)")
@@ -0,0 +1,46 @@
+"""files_changed trigger
+
+Revision ID: d5f1a7c3e862
+Revises: c2e8b4f6a153
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d5f1a7c3e862"
+down_revision: Union[str, None] = "c2e8b4f6a153"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Invalidates the file caches of the API workers, notifications are sent on
+    # commit. The epoch of the change measures their lag.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_files_changed()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'files_changed',
+                OLD.id::text || ' ' || extract(epoch FROM clock_timestamp())
+            );
+            RETURN NULL;
+        END;
+        $$
+        """)
+    op.execute("""
+        CREATE TRIGGER files_changed
+        AFTER UPDATE OR DELETE ON files
+        FOR EACH ROW EXECUTE FUNCTION notify_files_changed()
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS files_changed ON files")
+    op.execute("DROP FUNCTION IF EXISTS notify_files_changed()")
@@ -0,0 +1,30 @@
+"""upload sessions completing_at
+
+Revision ID: e7b3c9a1d452
+Revises: d5f1a7c3e862
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b3c9a1d452"
+down_revision: Union[str, None] = "d5f1a7c3e862"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable without a default, adding it does not rewrite the table
+    op.add_column(
+        "upload_sessions",
+        sa.Column("completing_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("upload_sessions", "completing_at")
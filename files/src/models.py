@@ -1,6 +1,6 @@
 from uuid import uuid4
 
-from sqlalchemy import Column, DateTime, func, Integer, String
+from sqlalchemy import Column, DateTime, func, Index, Integer, String, Text, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import DeclarativeBase
 
@@ -13,6 +13,32 @@ class Base(DeclarativeBase):
 
 class File(Base):
     __tablename__ = "files"
+    # Fetch server generated values (timestamps) with RETURNING, the async
+    # session can not lazy load them after a flush
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        Index("ix_files_user_id_updated_at", "user_id", "updated_at", "id"),
+        Index("ix_files_user_id_created_at", "user_id", "created_at", "id"),
+        Index(
+            "ix_files_user_id_updated_at_active",
+            "user_id",
+            "updated_at",
+            "id",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_files_user_id_created_at_active",
+            "user_id",
+            "created_at",
+            "id",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_files_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=False)
@@ -26,3 +52,64 @@ class File(Base):
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
     deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Hex digest of the content, null for files created from a local path
+    sha256 = Column(String(64), nullable=True)
+
+
+class Blob(Base):
+    """
+    Content addressed storage, a blob is stored once and shared by every file
+    with the same content until the last one is deleted.
+    """
+
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UploadSession(Base):
+    """
+    A file uploaded in numbered chunks, received chunks are tracked by the chunk
+    files in the session directory.
+    """
+
+    __tablename__ = "upload_sessions"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    filename = Column(String(StringLength.FILE_FILENAME), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    extra = Column(JSONB, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    # Set while the chunks are assembled, outside of any transaction
+    completing_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class Job(Base):
+    """
+    A background job, claimed by a worker with FOR UPDATE SKIP LOCKED and
+    deleted when done. Enqueued in the transaction of the change it follows up
+    (outbox), so it exists if and only if the change is committed.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_run_at", "run_at", postgresql_where=text("failed_at IS NULL")),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    # Set when the job gave up after its max attempts
+    failed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -2,8 +2,10 @@ from fastapi import APIRouter
 
 from .files import router as files_router
 from .internal import router as internal_router
+from .uploads import router as uploads_router
 
 router = APIRouter(prefix="/v1")
 router.include_router(files_router)
 router.include_router(internal_router)
+router.include_router(uploads_router)
 
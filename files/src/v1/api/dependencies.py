@@ -1,22 +1,21 @@
 from uuid import UUID
 
-from fastapi import Request
-from sqlalchemy.orm import Session
+from fastapi import Depends, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..clients.users import UsersClient
 from ..exceptions.authorization import AuthorizationNotProvided, Forbidden
-from ..exceptions.files import FileNotFound
-from ..repositories import Repository
 from ..repositories.files import FileRepository
-from ..repositories.permissions import PermissionRepository
-from ..schemas.files import AuthorizationContext
+from ..repositories.upload_sessions import UploadSessionRepository
+from ..schemas.files import AuthorizationContext, File
 from ..services.files import FileService
 from ..services.internal import FileInternalService
 from ..services.storage import LocalStorageService
 from ..services.permissions import PermissionService
+from ..services.upload_sessions import UploadSessionService
 from ...config import APIConfig, FilesConfig
-from ...db import engine
-
+from ...db import async_session
 
 api_config = APIConfig()
 files_config = FilesConfig()
@@ -27,7 +26,7 @@ async def get_user_id(request: Request) -> UUID:
     Get X-User-ID header, or validate the Authorization header with the Users service.
     """
 
-    return "00000000-0000-0000-0000-000000000000"
+    return UUID("00000000-0000-0000-0000-000000000000")
 
     # if user_id := request.headers.get(api_config.user_id_header):
     #     return UUID(user_id)
@@ -46,72 +45,90 @@ async def validate_allowed_host(request: Request) -> None:
         raise Forbidden()
 
 
-def get_db_session():
-    return Session(bind=engine)
-
-
-def get_repository(repo_class: Repository, db_session: Session | None = None):
-    db_session = db_session or get_db_session()
+async def get_db_session():
+    """
+    One session per request, shared by every repository and service of the request
+    and closed on teardown.
+    """
+    async with async_session() as session:
+        yield session
 
-    return repo_class(db_session)
 
+def get_file_repository(
+    db_session: AsyncSession = Depends(get_db_session),
+) -> FileRepository:
+    return FileRepository(db_session)
 
-def get_permission_service(
-    repository: PermissionRepository | None = None,
-):
-    repository = repository or get_repository(PermissionRepository)
 
-    return PermissionService(repo=repository)
+def get_permission_service() -> PermissionService:
+    return PermissionService()
 
 
 def get_file_service(
-    repository: FileRepository | None = None,
-    storage: LocalStorageService | None = None,
-    permission_service: PermissionService | None = None,
-):
-    repository = repository or get_repository(FileRepository)
-    storage = storage or LocalStorageService(config=files_config)
-    permission_service = permission_service or get_permission_service()
-
+    repository: FileRepository = Depends(get_file_repository),
+    permission_service: PermissionService = Depends(get_permission_service),
+) -> FileService:
     return FileService(
         config=files_config,
         repo=repository,
-        storage=storage,
+        storage=LocalStorageService(config=files_config),
         permission_service=permission_service,
     )
 
 
-def get_file_internal_service(repository: FileRepository | None = None):
-    repository = repository or get_repository(FileRepository)
+def get_upload_session_repository(
+    db_session: AsyncSession = Depends(get_db_session),
+) -> UploadSessionRepository:
+    return UploadSessionRepository(db_session)
+
 
+def get_upload_session_service(
+    repository: UploadSessionRepository = Depends(get_upload_session_repository),
+    file_service: FileService = Depends(get_file_service),
+) -> UploadSessionService:
+    return UploadSessionService(
+        config=files_config,
+        repo=repository,
+        storage=file_service.storage,
+        file_service=file_service,
+    )
+
+
+def get_file_internal_service(
+    repository: FileRepository = Depends(get_file_repository),
+) -> FileInternalService:
     return FileInternalService(repo=repository)
 
 
-def check_authorization(user_id: UUID, file_id: UUID):
+async def get_authorized_file(
+    file_id: UUID,
+    user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
+) -> File:
     """
-    Check authorization.
+    Load the file owned by the user.
 
     Raises:
         FileNotFound: if the user is not allowed to access the file
     """
-    svc = get_permission_service()
-
-    if not svc.check_file_permission(file_id=file_id, user_id=user_id):
-        raise FileNotFound(file_id=file_id, user_id=user_id)
+    return await svc.get_authorized(file_id, user_id=user_id)
 
 
-def check_authorization_with_context(
-    user_id: UUID, file_id: UUID, context: AuthorizationContext
-):
+async def get_authorized_file_with_context(
+    file_id: UUID,
+    request: Request,
+    user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
+) -> File:
     """
-    Check authorization with context.
+    Load the file, authorized with the attachment context when given in the query.
 
     Raises:
         FileNotFound: if the user is not allowed to access the file
     """
-    svc = get_permission_service()
+    try:
+        context = AuthorizationContext.model_validate(request.query_params)
+    except ValidationError:
+        context = None
 
-    if not svc.check_file_permission_with_context(
-        file_id=file_id, user_id=user_id, context=context
-    ):
-        raise FileNotFound(file_id=file_id, user_id=user_id)
+    return await svc.get_authorized(file_id, user_id=user_id, context=context)
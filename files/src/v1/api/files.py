@@ -1,29 +1,29 @@
-import json
 from datetime import datetime
 from http import HTTPStatus
 from uuid import UUID
 
 
 from fastapi import APIRouter, Depends, Request, Response
-from fastapi.responses import FileResponse
-from pydantic import ValidationError
+from fastapi.responses import JSONResponse
 
 from .dependencies import (
-    check_authorization,
-    check_authorization_with_context,
+    get_authorized_file,
+    get_authorized_file_with_context,
     get_file_service,
     get_user_id,
 )
-from ..exceptions.files import InvalidJSONContent
+from .responses import file_content_response
 from ..schemas.files import (
-    AuthorizationContext,
+    File,
     FileBatchGet,
+    FileBatchRequest,
     FileDetailsRequest,
     FileDetailsResponse,
     FileListRequest,
     FileUpdateRequest,
     LocalFileCreateRequest,
 )
+from ..services.files import FileService
 
 router = APIRouter(prefix="/files")
 
@@ -32,26 +32,27 @@ router = APIRouter(prefix="/files")
 async def list_files(
     data: FileListRequest = Depends(),
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    svc = get_file_service()
-
-    return svc.get_by_user_id_page_paginated(data, user_id=user_id)
+    # Already JSON, skips jsonable_encoder walking every item again
+    return JSONResponse(await svc.get_by_user_id_page_paginated(data, user_id=user_id))
 
 
 @router.post("/details")
 async def get_files_details(
     data: FileDetailsRequest,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
     DEPRECATION = datetime(2025, 5, 31, 23, 59, 59)
 
     if datetime.now() > DEPRECATION:
         raise Response(status_code=HTTPStatus.GONE)
 
-    svc = get_file_service()
+    details = await svc.get_by_ids(data=data, user_id=user_id)
 
     return Response(
-        content=svc.get_by_ids(data=data, user_id=user_id).model_dump_json(),
+        content=details.model_dump_json(),
         media_type="application/json",
         headers={"Deprecation": f"@{int(DEPRECATION.timestamp())}"},
     )
@@ -61,105 +62,92 @@ async def get_files_details(
 async def batch_get_files(
     data: FileBatchGet,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
+):
+    return JSONResponse(await svc.batch_get(data=data, user_id=user_id))
+
+
+@router.post("/batch-delete")
+async def batch_delete_files(
+    data: FileBatchRequest,
+    user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    svc = get_file_service()
+    return await svc.batch_delete(data=data, user_id=user_id)
+
 
-    return svc.batch_get(data=data, user_id=user_id)
+@router.post("/batch-soft-delete")
+async def batch_soft_delete_files(
+    data: FileBatchRequest,
+    user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
+):
+    return await svc.batch_soft_delete(data=data, user_id=user_id)
+
+
+@router.post("/batch-restore")
+async def batch_restore_files(
+    data: FileBatchRequest,
+    user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
+):
+    return await svc.batch_restore(data=data, user_id=user_id)
 
 
 @router.post("")
 async def create_files(
     request: Request,
+    atomic: bool = True,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    svc = get_file_service()
-    created = []
-
+    """
+    If atomic, nothing is created when a file fails and the created files are
+    returned. Otherwise the result of each file is returned in order.
+    """
     if request.headers.get("Content-Type") == "application/json":
         json_data = [
             LocalFileCreateRequest.model_validate(obj) for obj in await request.json()
         ]
 
-        for req in json_data:
-            file = svc.create_from_local(data=req, user_id=user_id)
-
-            created.append(file)
+        results = await svc.create_many_from_local(
+            data=json_data, user_id=user_id, atomic=atomic
+        )
     else:
-        form_data = await request.form()
-        files = form_data.getlist("files")
-        extra = form_data.get("extra")
-
-        if extra:
-            try:
-                extra = json.loads(extra)
-            except json.JSONDecodeError as e:
-                raise InvalidJSONContent(details=e.msg)
-
-        for file in files:
-            file = svc.create_from_binary(
-                bytes=file.file,
-                size_bytes=file.size,
-                filename=file.filename,
-                user_id=user_id,
-                extra=extra,
-            )
+        content_length = request.headers.get("Content-Length")
+
+        results = await svc.create_from_multipart(
+            stream=request.stream(),
+            content_type=request.headers.get("Content-Type", ""),
+            content_length=int(content_length) if content_length else None,
+            user_id=user_id,
+            atomic=atomic,
+        )
 
-            created.append(file)
+    if atomic:
+        return [result.file for result in results]
 
-    return created
+    return results
 
 
 @router.get("/{file_id}")
 async def get_file(
-    file_id: UUID,
-    request: Request,
-    user_id: UUID = Depends(get_user_id),
+    file: File = Depends(get_authorized_file_with_context),
 ):
-    try:
-        context = AuthorizationContext.model_validate(request.query_params)
-    except ValidationError:
-        context = None
-
-    if context:
-        check_authorization_with_context(
-            user_id=user_id, file_id=file_id, context=context
-        )
-    else:
-        check_authorization(user_id=user_id, file_id=file_id)
-
-    svc = get_file_service()
-
-    return svc.get(file_id)
+    return File.model_validate(file)
 
 
 @router.get("/{file_id}/content")
 async def get_file_content(
-    file_id: UUID,
     request: Request,
-    user_id: UUID = Depends(get_user_id),
+    file: File = Depends(get_authorized_file_with_context),
 ):
-    try:
-        context = AuthorizationContext.model_validate(request.query_params)
-    except ValidationError:
-        context = None
-
-    if context:
-        check_authorization_with_context(
-            user_id=user_id, file_id=file_id, context=context
-        )
-    else:
-        check_authorization(user_id=user_id, file_id=file_id)
-
-    svc = get_file_service()
-
-    file = svc.get(file_id)
-
     if file.extension == "wav":
         media_type = "audio/wav"
     else:
         media_type = "application/octet-stream"
 
-    return FileResponse(file.path, media_type=media_type, filename=file.filename)
+    return file_content_response(request, file, media_type=media_type)
 
 
 @router.put("/{file_id}")
@@ -167,24 +155,30 @@ async def update_file(
     file_id: UUID,
     data: FileUpdateRequest,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    check_authorization(user_id=user_id, file_id=file_id)
-
-    svc = get_file_service()
+    return await svc.update(file_id, user_id=user_id, data=data)
 
-    return svc.update(file_id, data)
 
-
-@router.delete("/{file_id}")
-async def delete_file(
+@router.patch("/{file_id}")
+async def patch_file(
     file_id: UUID,
+    data: FileUpdateRequest,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    check_authorization(user_id=user_id, file_id=file_id)
+    """
+    JSON merge patch (RFC 7396) of extra: objects are merged, null removes a key.
+    """
+    return await svc.patch(file_id, user_id=user_id, data=data)
 
-    svc = get_file_service()
 
-    svc.delete(file_id)
+@router.delete("/{file_id}")
+async def delete_file(
+    file: File = Depends(get_authorized_file),
+    svc: FileService = Depends(get_file_service),
+):
+    await svc.delete(file)
 
     return Response(status_code=204)
 
@@ -193,12 +187,9 @@ async def delete_file(
 async def soft_delete_file(
     file_id: UUID,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    check_authorization(user_id=user_id, file_id=file_id)
-
-    svc = get_file_service()
-
-    svc.soft_delete(file_id)
+    await svc.soft_delete(file_id, user_id=user_id)
 
     return Response(status_code=204)
 
@@ -207,9 +198,6 @@ async def soft_delete_file(
 async def restore_file(
     file_id: UUID,
     user_id: UUID = Depends(get_user_id),
+    svc: FileService = Depends(get_file_service),
 ):
-    check_authorization(user_id=user_id, file_id=file_id)
-
-    svc = get_file_service()
-
-    return svc.restore(file_id)
+    return await svc.restore(file_id, user_id=user_id)
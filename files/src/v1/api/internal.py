@@ -1,9 +1,22 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Request
 
-from .dependencies import get_file_internal_service, validate_allowed_host
+from .dependencies import (
+    get_file_internal_service,
+    get_permission_service,
+    validate_allowed_host,
+)
+from .responses import file_content_response
+from ..clients.users import token_cache
+from ..schemas.permissions import (
+    PermissionInvalidateRequest,
+    PermissionInvalidateResponse,
+)
+from ..services.executor import io_executors
+from ..services.file_cache import file_cache
+from ..services.internal import FileInternalService
+from ..services.permissions import PermissionService, permission_cache
 
 router = APIRouter(prefix="/internal")
 
@@ -11,12 +24,38 @@ router = APIRouter(prefix="/internal")
 @router.get("/files/{file_id}/content")
 async def get_file_content(
     file_id: UUID,
+    request: Request,
+    svc: FileInternalService = Depends(get_file_internal_service),
     _=Depends(validate_allowed_host),
 ):
-    svc = get_file_internal_service()
+    file = await svc.get(file_id)
 
-    file = svc.get(file_id)
+    return file_content_response(request, file)
 
-    return FileResponse(
-        file.path, media_type="application/octet-stream", filename=file.filename
-    )
+
+@router.post("/permissions/invalidate")
+async def invalidate_permissions(
+    data: PermissionInvalidateRequest,
+    svc: PermissionService = Depends(get_permission_service),
+    _=Depends(validate_allowed_host),
+):
+    """
+    Called when permissions change in the Bases service. Caches are per worker, the
+    TTLs bound how long other workers may serve the old decision.
+    """
+    invalidated = svc.invalidate_permissions(**data.model_dump())
+
+    return PermissionInvalidateResponse(invalidated=invalidated)
+
+
+@router.get("/metrics")
+async def get_metrics(_=Depends(validate_allowed_host)):
+    """
+    Metrics of this worker.
+    """
+    return {
+        "permission_cache": permission_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "storage_io": io_executors.stats(),
+        "file_cache": file_cache.stats(),
+    }
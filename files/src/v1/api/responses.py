@@ -0,0 +1,115 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from ..schemas.files import File
+from ...config import FilesConfig
+
+files_config = FilesConfig()
+
+# The content of a file never changes, a new upload is a new file. Private on
+# purpose: access is per user and can be revoked (attachment permissions), which
+# a shared proxy cache could not check, so only browser caches store the content.
+# Through the proxy, repeat downloads are revalidated with a 304 answered without
+# reading the file.
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def get_etag(file: File) -> str:
+    """
+    Strong ETag, the content hash or else the id and size of the immutable content.
+    """
+    if file.sha256:
+        return f'"{file.sha256}"'
+
+    return f'"{file.id}-{file.size_bytes}"'
+
+
+def is_not_modified(request: Request, etag: str, file: File) -> bool:
+    """
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2).
+    """
+    if if_none_match := request.headers.get("if-none-match"):
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+        return "*" in tags or etag in tags
+
+    if if_modified_since := request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None or file.created_at is None:
+            return False
+
+        return int(file.created_at.timestamp()) <= since.timestamp()
+
+    return False
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Same as FileResponse.
+    """
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+
+    return f'attachment; filename="{filename}"'
+
+
+def get_offload_headers(file: File, config: FilesConfig) -> dict[str, str] | None:
+    """
+    Headers handing the file over to the proxy, None to send it from the worker
+    (direct mode, or a file outside base_path the proxy does not serve).
+    """
+    if config.download_mode not in ("x-accel-redirect", "x-sendfile"):
+        return None
+
+    path = Path(os.path.normpath(file.path))
+    base_path = Path(os.path.abspath(config.base_path))
+    if not path.is_relative_to(base_path):
+        return None
+
+    if config.download_mode == "x-sendfile":
+        return {"x-sendfile": str(path)}
+
+    prefix = config.download_accel_prefix.rstrip("/")
+    relative = quote(path.relative_to(base_path).as_posix())
+
+    return {"x-accel-redirect": f"{prefix}/{relative}"}
+
+
+def file_content_response(
+    request: Request,
+    file: File,
+    media_type: str = "application/octet-stream",
+) -> Response:
+    """
+    The content of the file with validators for conditional requests. Range and
+    If-Range requests, single or multiple ranges, are served by FileResponse
+    with these validators, or by the proxy when the download is offloaded.
+    """
+    headers = {"etag": get_etag(file), "cache-control": CACHE_CONTROL}
+    if file.created_at is not None:
+        headers["last-modified"] = formatdate(file.created_at.timestamp(), usegmt=True)
+
+    if is_not_modified(request, headers["etag"], file):
+        return Response(status_code=304, headers=headers)
+
+    if offload := get_offload_headers(file, files_config):
+        # The proxy serves the bytes with sendfile and keeps these headers
+        return Response(
+            media_type=media_type,
+            headers=headers
+            | offload
+            | {"content-disposition": content_disposition(file.filename)},
+        )
+
+    return FileResponse(
+        file.path, media_type=media_type, filename=file.filename, headers=headers
+    )
@@ -0,0 +1,60 @@
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Request, Response
+
+from .dependencies import get_upload_session_service, get_user_id
+from ..schemas.uploads import UploadSessionCreateRequest
+from ..services.upload_sessions import UploadSessionService
+
+router = APIRouter(prefix="/uploads")
+
+
+@router.post("")
+async def create_upload_session(
+    data: UploadSessionCreateRequest,
+    user_id: UUID = Depends(get_user_id),
+    svc: UploadSessionService = Depends(get_upload_session_service),
+):
+    return await svc.create(data, user_id=user_id)
+
+
+@router.get("/{session_id}")
+async def get_upload_session(
+    session_id: UUID,
+    user_id: UUID = Depends(get_user_id),
+    svc: UploadSessionService = Depends(get_upload_session_service),
+):
+    return await svc.get(session_id, user_id=user_id)
+
+
+@router.put("/{session_id}/chunks/{index}")
+async def put_upload_chunk(
+    session_id: UUID,
+    index: int,
+    request: Request,
+    user_id: UUID = Depends(get_user_id),
+    svc: UploadSessionService = Depends(get_upload_session_service),
+):
+    await svc.put_chunk(session_id, index, request.stream(), user_id=user_id)
+
+    return Response(status_code=204)
+
+
+@router.post("/{session_id}/complete")
+async def complete_upload_session(
+    session_id: UUID,
+    user_id: UUID = Depends(get_user_id),
+    svc: UploadSessionService = Depends(get_upload_session_service),
+):
+    return await svc.complete(session_id, user_id=user_id)
+
+
+@router.delete("/{session_id}")
+async def delete_upload_session(
+    session_id: UUID,
+    user_id: UUID = Depends(get_user_id),
+    svc: UploadSessionService = Depends(get_upload_session_service),
+):
+    await svc.delete(session_id, user_id=user_id)
+
+    return Response(status_code=204)
@@ -1,3 +1,50 @@
+import importlib.util
+
+import httpx
+from loguru import logger
+
 from ...config import APIConfig
 
-api_config = APIConfig()
\ No newline at end of file
+api_config = APIConfig()
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(
+    base_url: str,
+    timeout: float,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    http2: bool = False,
+) -> httpx.AsyncClient:
+    """
+    Process wide client of a service, so requests reuse pooled keep-alive
+    connections instead of connecting for every call.
+    """
+    client = _clients.get(base_url)
+
+    if client is None or client.is_closed:
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("h2 is not installed, using HTTP/1.1 for {}", base_url)
+            http2 = False
+
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+        )
+        _clients[base_url] = client
+
+    return client
+
+
+async def close_http_clients():
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
@@ -1,14 +1,22 @@
+import asyncio
+import time
 from enum import StrEnum
 from http import HTTPStatus
-from urllib.parse import urljoin
 from uuid import UUID
 
 import httpx
 from pydantic import BaseModel
 
-from . import api_config
+from . import api_config, get_http_client
 from ..exceptions.services import BasesServiceNotAvailable
 
+# Responses of a Bases service without the batch endpoint
+BATCH_UNSUPPORTED = {
+    HTTPStatus.NOT_FOUND,
+    HTTPStatus.METHOD_NOT_ALLOWED,
+    HTTPStatus.NOT_IMPLEMENTED,
+}
+
 
 class PrincipalType(StrEnum):
     USER = "user"
@@ -32,25 +40,100 @@ class PermissionCheck(BaseModel):
 
 
 class BasesClient:
+    # Monotonic time until which the batch endpoint is known to be unsupported
+    _batch_unsupported_until: float = 0.0
+    BATCH_RETRY_INTERVAL = 300
+
     def __init__(self, base_url: str | None = None):
         self.base_url = base_url or api_config.bases_base_url
         self.user_id_header = api_config.user_id_header
-
-    def check_permissions(self, user_id: UUID, data: PermissionCheck) -> bool:
+        self.client = get_http_client(
+            self.base_url,
+            timeout=api_config.bases_timeout,
+            max_connections=api_config.bases_max_connections,
+            max_keepalive_connections=api_config.bases_max_keepalive_connections,
+            keepalive_expiry=api_config.bases_keepalive_expiry,
+            http2=api_config.bases_http2,
+        )
+
+    async def check_permissions(self, user_id: UUID, data: PermissionCheck) -> bool:
         try:
-            with httpx.Client() as client:
-                response = client.get(
-                    urljoin(self.base_url, "/v1/permissions/check"),
+            response = await self.client.get(
+                "/v1/permissions/check",
+                headers={self.user_id_header: str(user_id)},
+                params=data.model_dump(mode="json", exclude_none=True),
+            )
+
+            if HTTPStatus(response.status_code).is_success:
+                return True
+            elif HTTPStatus(response.status_code).is_client_error:
+                return False
+            if HTTPStatus(response.status_code).is_server_error:
+                raise BasesServiceNotAvailable()
+
+        except httpx.RequestError:
+            raise BasesServiceNotAvailable()
+
+    async def check_permissions_batch(
+        self, user_id: UUID, checks: list[PermissionCheck]
+    ) -> list[bool]:
+        """
+        Check many permissions in one round-trip. Falls back to concurrent single
+        checks when the Bases service does not support checking in batch.
+
+        Returns:
+            list[bool]: The decisions, in the order of the checks
+        """
+        if not checks:
+            return []
+
+        if time.monotonic() >= BasesClient._batch_unsupported_until:
+            try:
+                response = await self.client.post(
+                    "/v1/permissions/batch-check",
                     headers={self.user_id_header: str(user_id)},
-                    params=data.model_dump(mode="json", exclude_none=True),
+                    json={
+                        "items": [
+                            check.model_dump(mode="json", exclude_none=True)
+                            for check in checks
+                        ]
+                    },
                 )
+            except httpx.RequestError:
+                raise BasesServiceNotAvailable()
 
-                if HTTPStatus(response.status_code).is_success:
-                    return True
-                elif HTTPStatus(response.status_code).is_client_error:
-                    return False
-                if HTTPStatus(response.status_code).is_server_error:
-                    raise BasesServiceNotAvailable()
+            if response.status_code in BATCH_UNSUPPORTED:
+                BasesClient._batch_unsupported_until = (
+                    time.monotonic() + self.BATCH_RETRY_INTERVAL
+                )
+            elif HTTPStatus(response.status_code).is_success:
+                return self.parse_decisions(response, len(checks))
+            else:
+                raise BasesServiceNotAvailable()
+
+        semaphore = asyncio.Semaphore(api_config.bases_check_concurrency)
+
+        async def check_permissions(check: PermissionCheck) -> bool:
+            async with semaphore:
+                return await self.check_permissions(user_id=user_id, data=check)
+
+        return list(await asyncio.gather(*map(check_permissions, checks)))
+
+    @staticmethod
+    def parse_decisions(response: httpx.Response, count: int) -> list[bool]:
+        """
+        Raises:
+            BasesServiceNotAvailable: if the response is malformed or does not
+                decide every check
+        """
+        try:
+            decisions = [item["allowed"] for item in response.json()["items"]]
+        except (ValueError, KeyError, TypeError):
+            raise BasesServiceNotAvailable()
 
-        except httpx.RequestError:
+        if len(decisions) != count or not all(
+            isinstance(allowed, bool) for allowed in decisions
+        ):
             raise BasesServiceNotAvailable()
+
+        return decisions
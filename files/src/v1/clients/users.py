@@ -1,18 +1,36 @@
+import asyncio
+import hashlib
 import json
-from urllib.parse import urljoin
 from uuid import UUID
 
 import httpx
 
-from . import api_config
+from . import api_config, get_http_client
 from ..exceptions.authorization import AuthorizationInvalid
 from ..exceptions.services import UsersServiceNotAvailable
+from ...cache import MISSING, TTLCache
+from ...config import TokenCacheConfig
+
+token_cache_config = TokenCacheConfig()
+
+# SHA-256 of the Authorization header -> user ID, or None if invalid. The raw
+# token is never kept.
+token_cache = TTLCache(max_size=token_cache_config.max_size)
+# Validations in flight, concurrent requests with the same token share them
+_validations: dict[bytes, asyncio.Future] = {}
 
 
 class UsersClient:
 
     def __init__(self, base_url: str | None = None):
         self.base_url = base_url or api_config.users_base_url
+        self.client = get_http_client(
+            self.base_url,
+            timeout=api_config.users_timeout,
+            max_connections=api_config.users_max_connections,
+            max_keepalive_connections=api_config.users_max_keepalive_connections,
+            keepalive_expiry=api_config.users_keepalive_expiry,
+        )
 
     async def get_user_id(self, authorization: str) -> UUID:
         """
@@ -28,21 +46,41 @@ class UsersClient:
             UsersServiceNotAvailable: If the Users service is not available
             AuthorizationInvalid: If the Authorization header is invalid
         """
+        key = hashlib.sha256(authorization.encode()).digest()
+
+        if (user_id := token_cache.get(key)) is not MISSING:
+            if user_id is None:
+                raise AuthorizationInvalid()
+            return user_id
+
+        if (validation := _validations.get(key)) is None:
+            validation = asyncio.ensure_future(self._validate(key, authorization))
+            _validations[key] = validation
+            validation.add_done_callback(lambda _: _validations.pop(key, None))
+
+        # A cancelled request must not cancel the validation others wait for
+        return await asyncio.shield(validation)
+
+    async def _validate(self, key: bytes, authorization: str) -> UUID:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    urljoin(self.base_url, "/v1/users/validate"),
-                    headers={"Authorization": authorization},
-                )
-
-                if response.status_code >= 500:
-                    raise UsersServiceNotAvailable()
-                elif response.status_code == 401:
-                    raise AuthorizationInvalid()
-
-                try:
-                    return UUID(response.json()["user_id"])
-                except json.JSONDecodeError:
-                    pass
+            response = await self.client.get(
+                "/v1/users/validate",
+                headers={"Authorization": authorization},
+            )
+
+            if response.status_code >= 500:
+                raise UsersServiceNotAvailable()
+            elif response.status_code == 401:
+                token_cache.set(key, None, ttl=token_cache_config.invalid_ttl)
+                raise AuthorizationInvalid()
+
+            try:
+                user_id = UUID(response.json()["user_id"])
+            except json.JSONDecodeError:
+                return
+
+            token_cache.set(key, user_id, ttl=token_cache_config.ttl)
+
+            return user_id
         except httpx.RequestError as e:
             raise UsersServiceNotAvailable() from e
@@ -77,4 +77,33 @@ class FileTooLarge(Exception):
     # i18n_key="user.not_found"
 )
 class InvalidJSONContent(Exception):
-    pass
+    def __init__(self, details: str | None = None):
+        self.details = json.dumps({"message": details}) if details else None
+        super().__init__()
+
+
+@ErrorRegistry.register(
+    code="InvalidMultipartContent",
+    http_status=HTTPStatus.BAD_REQUEST,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class InvalidMultipartContent(Exception):
+    def __init__(self, details: str | None = None):
+        self.details = json.dumps({"message": details}) if details else None
+        super().__init__()
+
+
+@ErrorRegistry.register(
+    code="InvalidCursor",
+    http_status=HTTPStatus.BAD_REQUEST,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class InvalidCursor(Exception):
+    def __init__(self, cursor: str):
+        self.cursor = cursor
+        self.details = json.dumps({"cursor": cursor})
+        super().__init__()
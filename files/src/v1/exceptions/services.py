@@ -1,3 +1,4 @@
+import json
 from http import HTTPStatus
 
 from . import ErrorRegistry
@@ -23,3 +24,17 @@ class UsersServiceNotAvailable(Exception):
 )
 class BasesServiceNotAvailable(Exception):
     pass
+
+
+@ErrorRegistry.register(
+    code="StorageBusy",
+    http_status=HTTPStatus.SERVICE_UNAVAILABLE,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class StorageBusy(Exception):
+    def __init__(self, volume: str):
+        self.volume = volume
+        self.details = json.dumps({"volume": volume})
+        super().__init__()
@@ -0,0 +1,65 @@
+import json
+from http import HTTPStatus
+from uuid import UUID
+
+from . import ErrorRegistry
+
+
+@ErrorRegistry.register(
+    code="UploadSessionNotFound",
+    http_status=HTTPStatus.NOT_FOUND,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class UploadSessionNotFound(Exception):
+    def __init__(self, session_id: UUID):
+        self.session_id = session_id
+        self.details = json.dumps({"session_id": str(session_id)})
+        super().__init__()
+
+
+@ErrorRegistry.register(
+    code="InvalidChunk",
+    http_status=HTTPStatus.BAD_REQUEST,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class InvalidChunk(Exception):
+    def __init__(self, index: int, expected_size: int | None, size: int | None = None):
+        self.index = index
+        self.expected_size = expected_size
+        self.size = size
+        self.details = json.dumps(
+            {"index": index, "expected_size": expected_size, "size": size}
+        )
+        super().__init__()
+
+
+@ErrorRegistry.register(
+    code="UploadIncomplete",
+    http_status=HTTPStatus.CONFLICT,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class UploadIncomplete(Exception):
+    def __init__(self, missing: list[int]):
+        self.missing = missing
+        self.details = json.dumps({"missing": missing})
+        super().__init__()
+
+
+@ErrorRegistry.register(
+    code="UploadCompleting",
+    http_status=HTTPStatus.CONFLICT,
+    description="",
+    is_technical=False,
+    # i18n_key="user.not_found"
+)
+class UploadCompleting(Exception):
+    def __init__(self, session_id: UUID):
+        self.session_id = session_id
+        self.details = json.dumps({"session_id": str(session_id)})
+        super().__init__()
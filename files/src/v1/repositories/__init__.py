@@ -1,34 +1,63 @@
 from typing import NamedTuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import ColumnElement, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ...db import engine
+from ...db import async_session
 
 
 class Pagination(NamedTuple):
 
-    total: int
-    pages: int
-    page: int
+    total: int | None
+    pages: int | None
+    page: int | None
     page_size: int
     items: list
+    next_cursor: str | None = None
+
+
+def any_of(column, values: list) -> ColumnElement[bool]:
+    """
+    `column = ANY(:values)`, bound as a single array parameter. Unlike an IN list,
+    the statement is the same for any number of values.
+    """
+    return column == any_(literal(list(values), ARRAY(column.type)))
 
 
 class Repository:
 
-    def __init__(self, session: Session | None = None):
-        self.session = session if session else Session(bind=engine)
+    def __init__(self, session: AsyncSession | None = None):
+        # A session passed in is shared (e.g. request scoped), its owner closes it
+        self.owns_session = session is None
+        self.session = session if session else async_session()
 
-    def __enter__(self):
+    async def __aenter__(self):
+        # Blocks of repositories sharing the session may nest, only the outermost
+        # ends the transaction
+        self.session.info["depth"] = self.session.info.get("depth", 0) + 1
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type:  # Check if an exception occurred
-            self.session.rollback()  # Roll back the session to revert changes
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.session.info["depth"] -= 1
+        if self.session.info["depth"]:
+            if exc_type:
+                raise exc_val
+            return
 
-        self.session.close()  # Close the session in any case
+        if exc_type:  # Check if an exception occurred
+            await self.session.rollback()  # Roll back the session to revert changes
+
+        if self.owns_session:
+            await self.session.close()  # Close the session in any case
+        elif not exc_type and self.session.in_transaction():
+            # A shared session lives until the response is sent, ending the
+            # transaction returns its connection to the pool instead of holding
+            # it idle in transaction across permission calls and downloads.
+            # Objects are not expired on commit, so they stay usable
+            await self.session.commit()
         if exc_type:  # Re-raise the exception after handling it
             raise exc_val
 
-    def commit(self):
-        self.session.commit()
+    async def commit(self):
+        await self.session.commit()
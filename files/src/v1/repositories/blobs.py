@@ -0,0 +1,76 @@
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Repository
+from ...models import Blob
+
+
+class BlobRepository(Repository):
+    def __init__(self, session: AsyncSession | None = None):
+        super().__init__(session)
+
+    async def acquire(
+        self, sha256: str, path: str, size_bytes: int
+    ) -> tuple[str, bool]:
+        """
+        Add a reference to the blob, creating it at path if it does not exist.
+        A concurrent acquire of the same blob waits for this transaction.
+
+        Returns:
+            The path of the blob, and whether it was created
+        """
+        statement = insert(Blob).values(
+            sha256=sha256, path=path, size_bytes=size_bytes, refcount=1
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"refcount": Blob.refcount + 1},
+        ).returning(Blob.path, Blob.refcount == 1)
+        row = (await self.session.execute(statement)).one()
+
+        return row[0], row[1]
+
+    async def release(self, sha256: str, path: str, count: int = 1) -> bool | None:
+        """
+        Drop count references to the blob stored at path, the blob row is deleted
+        with the last reference.
+
+        Returns:
+            None if path is not a blob, otherwise whether it has no references left
+        """
+        refcount = await self.session.scalar(
+            update(Blob)
+            .where(Blob.sha256 == sha256, Blob.path == path)
+            .values(refcount=Blob.refcount - count)
+            .returning(Blob.refcount)
+        )
+        if refcount is None:
+            return None
+
+        if refcount <= 0:
+            await self.session.execute(delete(Blob).where(Blob.sha256 == sha256))
+
+        return refcount <= 0
+
+    async def lock_absent(self, sha256: str, path: str) -> bool:
+        """
+        Whether the blob has no row, i.e. no upload created it again since its
+        last release. The blob is then held by a placeholder row until the
+        transaction ends, remove it before commit; a concurrent acquire waits.
+        """
+        statement = (
+            insert(Blob)
+            .values(sha256=sha256, path=path, size_bytes=0, refcount=0)
+            .on_conflict_do_nothing(index_elements=[Blob.sha256])
+            .returning(Blob.sha256)
+        )
+
+        return await self.session.scalar(statement) is not None
+
+    async def remove(self, path: str) -> None:
+        """
+        Delete the row of an unreferenced blob file, a concurrent acquire waits
+        for this transaction.
+        """
+        await self.session.execute(delete(Blob).where(Blob.path == path))
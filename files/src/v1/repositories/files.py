@@ -1,73 +1,132 @@
+import base64
+import binascii
+import json
 import math
+from datetime import datetime
 from pathlib import Path
-from typing import Literal
+from typing import Any, AsyncIterator, Literal
 from uuid import UUID
 
-from sqlalchemy import asc, desc, func
-from sqlalchemy.orm import Session
-
-from . import Pagination, Repository
-from ..exceptions.files import FileNotExists
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    asc,
+    bindparam,
+    case,
+    delete,
+    desc,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Pagination, Repository, any_of
+from ..exceptions.files import FileNotExists, InvalidCursor
 from ...models import File
 
+# Plain rows of these skip the ORM identity map and attribute instrumentation
+FILE_COLUMNS = tuple(File.__table__.columns)
+
+
+def encode_cursor(order_by: str, order: str, file: File) -> str:
+    """
+    Opaque cursor of the (order_by, id) key of the last item of a page.
+    """
+    value = getattr(file, order_by)
+    payload = json.dumps([order_by, order, value.isoformat(), str(file.id)])
+
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, order_by: str, order: str) -> tuple[datetime, UUID]:
+    """
+    Raises:
+        InvalidCursor: if the cursor is malformed or was issued for another ordering
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        cursor_order_by, cursor_order, value, id = payload
+        value, id = datetime.fromisoformat(value), UUID(id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+    if (cursor_order_by, cursor_order) != (order_by, order):
+        raise InvalidCursor(cursor)
+
+    return value, id
+
 
 class FileRepository(Repository):
-    def __init__(self, session: Session | None = None):
+    def __init__(self, session: AsyncSession | None = None):
         super().__init__(session)
 
-    def get(self, id: UUID, include_soft_deleted: bool = True) -> File:
-        query = self.session.query(File).filter(File.id == id)
+    async def get(self, id: UUID, include_soft_deleted: bool = True) -> File:
+        query = select(File).where(File.id == id)
 
         if not include_soft_deleted:
-            query = query.filter(File.deleted_at.is_(None))
+            query = query.where(File.deleted_at.is_(None))
 
-        file = query.one_or_none()
+        file = (await self.session.scalars(query)).one_or_none()
 
         if file is None:
             raise FileNotExists(id)
 
         return file
 
-    def get_by_user_id(
+    async def get_by_user_id(
         self,
         user_id: UUID,
         include_soft_deleted: bool = True,
     ) -> list[File]:
-        query = self.session.query(File).filter(File.user_id == user_id)
+        query = select(File).where(File.user_id == user_id)
 
         if not include_soft_deleted:
-            query = query.filter(File.deleted_at.is_(None))
+            query = query.where(File.deleted_at.is_(None))
 
-        return query.all()
+        return list(await self.session.scalars(query))
 
-    def get_by_ids(
+    async def get_by_ids(
         self,
         ids: list[UUID],
         include_soft_deleted: bool = True,
-    ) -> list[File]:
-        query = self.session.query(File).filter(File.id.in_(ids))
+        rows: bool = False,
+    ) -> list[File] | list[Row]:
+        """
+        With rows, plain rows of the columns are selected instead of File objects,
+        for read paths that only serialize them.
+        """
+        query = select(*FILE_COLUMNS if rows else (File,))
+        query = query.where(any_of(File.id, ids))
 
         if not include_soft_deleted:
-            query = query.filter(File.deleted_at.is_(None))
+            query = query.where(File.deleted_at.is_(None))
 
-        return query.all()
+        if rows:
+            return list(await self.session.execute(query))
 
-    def get_by_ids_and_user_id(
+        return list(await self.session.scalars(query))
+
+    async def get_by_ids_and_user_id(
         self,
         ids: list[UUID],
         user_id: UUID,
         include_soft_deleted: bool = True,
     ) -> list[File]:
-        query = self.session.query(File).filter(
-            File.id.in_(ids), File.user_id == user_id
-        )
+        query = select(File).where(any_of(File.id, ids), File.user_id == user_id)
 
         if not include_soft_deleted:
-            query = query.filter(File.deleted_at.is_(None))
+            query = query.where(File.deleted_at.is_(None))
 
-        return query.all()
+        return list(await self.session.scalars(query))
 
-    def get_by_user_id_page_paginated(
+    async def get_by_user_id_page_paginated(
         self,
         user_id: UUID,
         page: int = 1,
@@ -75,94 +134,439 @@ class FileRepository(Repository):
         order_by: Literal["created_at", "updated_at"] = "updated_at",
         order: Literal["asc", "desc"] = "desc",
         include_soft_deleted: bool = True,
+        cursor: str | None = None,
+        total: Literal["exact", "estimated", "none"] = "exact",
+        rows: bool = False,
     ) -> Pagination:
-        query = self.session.query(File).filter(File.user_id == user_id)
-
-        if not include_soft_deleted:
-            query = query.filter(File.deleted_at.is_(None))
+        """
+        Page by OFFSET, or by keyset when a cursor of a previous page is given.
+        Either way the next cursor is returned, so clients can switch to keyset
+        after the first page.
 
-        total = query.count()
-        pages = math.ceil(total / page_size)
+        With rows, the items are plain rows of the columns instead of File objects.
+        """
+        query = select(*FILE_COLUMNS if rows else (File,))
+        query = query.where(File.user_id == user_id)
 
+        if not include_soft_deleted:
+            query = query.where(File.deleted_at.is_(None))
+
+        match total:
+            case "exact":
+                count = await self.count(query)
+            case "estimated":
+                count = await self.estimate_count(query)
+            case _:
+                count = None
+        pages = math.ceil(count / page_size) if count is not None else None
+
+        # id breaks ties, so the order is total and the keyset is unique
         column = getattr(File, order_by)
         if order == "asc":
-            query = query.order_by(asc(column))
+            query = query.order_by(asc(column), asc(File.id))
         elif order == "desc":
-            query = query.order_by(desc(column))
-
-        query = query.limit(page_size).offset((page - 1) * page_size)
+            query = query.order_by(desc(column), desc(File.id))
+
+        if cursor:
+            key = tuple_(column, File.id)
+            after = tuple_(*decode_cursor(cursor, order_by, order))
+            query = query.where(key > after if order == "asc" else key < after)
+            page = None
+        else:
+            query = query.offset((page - 1) * page_size)
+
+        query = query.limit(page_size)
+        if rows:
+            items = list(await self.session.execute(query))
+        else:
+            items = list(await self.session.scalars(query))
+
+        next_cursor = None
+        if len(items) == page_size:
+            next_cursor = encode_cursor(order_by, order, items[-1])
 
         return Pagination(
-            total=total,
+            total=count,
             pages=pages,
             page=page,
             page_size=page_size,
-            items=query.all(),
+            items=items,
+            next_cursor=next_cursor,
         )
 
-    def create(
-        self,
+    async def get_after_id(self, after: UUID | None, limit: int) -> list[File]:
+        """
+        All files (soft deleted included) in id order, a batch at a time.
+        """
+        query = select(File).order_by(File.id).limit(limit)
+        if after is not None:
+            query = query.where(File.id > after)
+
+        return list(await self.session.scalars(query))
+
+    async def stream_by_path(
+        self, prefix: str, batch_size: int = 1000
+    ) -> AsyncIterator[tuple[UUID, str, datetime | None]]:
+        """
+        All files (soft deleted included) as (id, absolute path, deleted_at), in
+        byte order of the path, streamed with a server side cursor.
+
+        Args:
+            prefix: Directory the relative paths are relative to, with a trailing /
+        """
+        path = case(
+            (File.path.startswith("/"), File.path), else_=literal(prefix) + File.path
+        )
+        result = await self.session.stream(
+            select(File.id, path, File.deleted_at)
+            .order_by(path.collate("C"))
+            .execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            yield tuple(row)
+
+    async def exists_path(self, path: str) -> bool:
+        return await self.session.scalar(select(exists().where(File.path == path)))
+
+    async def update_paths(
+        self, moves: list[tuple[UUID, str, str]], commit: bool = True
+    ) -> list[UUID]:
+        """
+        Move files from their old path to a new one in one statement, a file
+        whose path has changed or that was deleted meanwhile is left alone.
+
+        Args:
+            moves: (id, old path, new path)
+
+        Returns:
+            The ids of the files moved
+        """
+        if not moves:
+            return []
+
+        ids, old_paths, new_paths = zip(*moves)
+        moved = (
+            func.unnest(
+                literal(list(ids), ARRAY(File.id.type)),
+                literal(list(old_paths), ARRAY(File.path.type)),
+                literal(list(new_paths), ARRAY(File.path.type)),
+            )
+            .table_valued("id", "old_path", "new_path")
+            .render_derived("moves")
+        )
+
+        updated = list(
+            await self.session.scalars(
+                update(File.__table__)
+                .where(
+                    File.__table__.c.id == moved.c.id,
+                    File.__table__.c.path == moved.c.old_path,
+                )
+                .values(path=moved.c.new_path)
+                .returning(File.__table__.c.id)
+            )
+        )
+
+        if commit:
+            await self.session.commit()
+
+        return updated
+
+    async def count(self, query: Select) -> int:
+        return await self.session.scalar(
+            select(func.count()).select_from(query.subquery())
+        )
+
+    async def estimate_count(self, query: Select) -> int:
+        """
+        Estimate the number of rows of the query from the planner statistics.
+        """
+        connection = await self.session.connection()
+        compiled = query.compile(dialect=connection.dialect)
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        )
+
+        return int(result.scalar()[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    def get_values(
         path: Path,
         user_id: UUID,
         filename: str | None = None,
         extra: dict | None = None,
-        commit: bool = True,
-    ) -> File:
-        file = File(
+        sha256: str | None = None,
+        extension: str | None = None,
+        size_bytes: int | None = None,
+    ) -> dict:
+        return dict(
             user_id=user_id,
             filename=filename if filename else path.name,
             path=str(path.absolute()),  # path is absolute
-            size_bytes=path.stat().st_size,
-            extension=path.suffix.lstrip("."),
+            size_bytes=size_bytes if size_bytes is not None else path.stat().st_size,
+            extension=(extension if extension is not None else path.suffix).lstrip("."),
             extra=extra,
+            sha256=sha256,
+        )
+
+    async def create(
+        self,
+        path: Path,
+        user_id: UUID,
+        filename: str | None = None,
+        extra: dict | None = None,
+        commit: bool = True,
+        sha256: str | None = None,
+        extension: str | None = None,
+        size_bytes: int | None = None,
+    ) -> File:
+        file = File(
+            **self.get_values(
+                path=path,
+                user_id=user_id,
+                filename=filename,
+                extra=extra,
+                sha256=sha256,
+                extension=extension,
+                size_bytes=size_bytes,
+            )
         )
 
         self.session.add(file)
 
         if commit:
-            self.session.commit()
+            await self.session.commit()
 
         return file
 
-    def update(self, id: UUID, extra: dict, commit: bool = True):
-        file = self.get(id)
+    async def create_many(self, files: list[dict], commit: bool = True) -> list[File]:
+        """
+        Create the files with one multi-row INSERT ... RETURNING.
+
+        Args:
+            files: the arguments of get_values for each file
+        """
+        if not files:
+            return []
 
-        file.extra = extra
+        created = await self.session.scalars(
+            insert(File).returning(File, sort_by_parameter_order=True),
+            [self.get_values(**file) for file in files],
+        )
+        created = list(created)
 
         if commit:
-            self.session.commit()
+            await self.session.commit()
 
-        return file
+        return created
 
-    def delete(self, id: UUID, commit: bool = True) -> None:
-        file = self.get(id)
+    async def copy(self, rows: list[tuple], commit: bool = True) -> None:
+        """
+        Load files with COPY, the fastest way to insert many rows. The rows are
+        copied into a temporary table and inserted from it skipping the ids that
+        already exist, so a batch loaded again is a no-op.
 
-        self.session.delete(file)
+        Args:
+            rows: (id, user_id, filename, path, size_bytes, extension)
+        """
+        if not rows:
+            return
+
+        columns = "id, user_id, filename, path, size_bytes, extension"
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        async with raw_connection.driver_connection.cursor() as cursor:
+            await cursor.execute(
+                "CREATE TEMPORARY TABLE files_copy (LIKE files INCLUDING DEFAULTS)"
+            )
+            async with cursor.copy(f"COPY files_copy ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    await copy.write_row(row)
+            await cursor.execute(
+                f"INSERT INTO files ({columns}) SELECT {columns} FROM files_copy"
+                " ON CONFLICT (id) DO NOTHING"
+            )
+            await cursor.execute("DROP TABLE files_copy")
 
         if commit:
-            self.session.commit()
+            await self.session.commit()
+
+    async def soft_delete_by_ids(self, ids: list[UUID], commit: bool = True) -> None:
+        await self.session.execute(
+            update(File)
+            .where(any_of(File.id, ids), File.deleted_at.is_(None))
+            .values(deleted_at=func.now())
+        )
+
+        if commit:
+            await self.session.commit()
+
+    async def purge(
+        self, before: datetime, limit: int
+    ) -> list[tuple[str, str | None, int]]:
+        """
+        Delete up to limit files soft deleted before a date, skipping the rows
+        locked by other transactions so purgers can run concurrently. The
+        transaction is left open.
 
-    def soft_delete(self, id: UUID, commit: bool = True) -> File:
+        Returns:
+            (path, sha256, size_bytes) of the deleted files
         """
-        Mark a file as deleted in the database.
+        ids = (
+            select(File.id)
+            .where(File.deleted_at < before)
+            .order_by(File.deleted_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.execute(
+            delete(File)
+            .where(File.id.in_(ids.scalar_subquery()))
+            .returning(File.path, File.sha256, File.size_bytes)
+        )
+
+        return [tuple(row) for row in result]
+
+    async def delete_by_ids_and_user_id(
+        self, ids: list[UUID], user_id: UUID
+    ) -> list[File]:
         """
-        file = self.get(id)
+        Delete the files of the user in one statement, the transaction is left
+        open.
 
-        if file.deleted_at is None:
-            file.deleted_at = func.now()
+        Returns:
+            The deleted files, the others are not found
+        """
+        return list(
+            await self.session.scalars(
+                delete(File)
+                .where(any_of(File.id, ids), File.user_id == user_id)
+                .returning(File)
+            )
+        )
 
-        if commit:
-            self.session.commit()
+    async def update(
+        self, id: UUID, user_id: UUID, extra: Any, commit: bool = True
+    ) -> File | None:
+        """
+        Replace the extra of a file of the user.
 
-        return file
+        Returns:
+            The updated file, None if not found
+        """
+        return await self.update_by_id_and_user_id(
+            id, user_id, {"extra": extra}, commit
+        )
+
+    async def patch(
+        self, id: UUID, user_id: UUID, extra: Any, commit: bool = True
+    ) -> File | None:
+        """
+        Apply a JSON merge patch (RFC 7396) to the extra of a file of the user.
+        The patch is merged by the database, so concurrent patches of different
+        keys do not overwrite each other.
 
-    def restore(self, id: UUID, commit: bool = True) -> File:
-        file = self.get(id)
+        Returns:
+            The updated file, None if not found
+        """
+        return await self.update_by_id_and_user_id(
+            id,
+            user_id,
+            {"extra": func.jsonb_merge_patch(File.extra, literal(extra, JSONB))},
+            commit,
+        )
+
+    async def soft_delete(
+        self, id: UUID, user_id: UUID, commit: bool = True
+    ) -> File | None:
+        """
+        Mark a file of the user as deleted, a file already deleted keeps its date.
+        """
+        files = await self.soft_delete_by_ids_and_user_id([id], user_id, commit)
+
+        return files[0] if files else None
+
+    async def restore(
+        self, id: UUID, user_id: UUID, commit: bool = True
+    ) -> File | None:
+        files = await self.restore_by_ids_and_user_id([id], user_id, commit)
+
+        return files[0] if files else None
+
+    async def soft_delete_by_ids_and_user_id(
+        self, ids: list[UUID], user_id: UUID, commit: bool = True
+    ) -> list[File]:
+        """
+        Mark the files of the user as deleted in one statement, the files already
+        deleted are returned as they are.
+        """
+        return await self.update_by_ids_and_user_id(
+            ids,
+            user_id,
+            {"deleted_at": func.now()},
+            commit,
+            where=File.deleted_at.is_(None),
+        )
+
+    async def restore_by_ids_and_user_id(
+        self, ids: list[UUID], user_id: UUID, commit: bool = True
+    ) -> list[File]:
+        return await self.update_by_ids_and_user_id(
+            ids,
+            user_id,
+            {"deleted_at": None},
+            commit,
+            where=File.deleted_at.is_not(None),
+        )
+
+    async def update_by_id_and_user_id(
+        self, id: UUID, user_id: UUID, values: dict, commit: bool = True
+    ) -> File | None:
+        files = await self.update_by_ids_and_user_id([id], user_id, values, commit)
 
-        if file.deleted_at is not None:
-            file.deleted_at = None
+        return files[0] if files else None
+
+    async def update_by_ids_and_user_id(
+        self,
+        ids: list[UUID],
+        user_id: UUID,
+        values: dict,
+        commit: bool = True,
+        where: ColumnElement[bool] | None = None,
+    ) -> list[File]:
+        """
+        Update the files of the user in one UPDATE ... RETURNING statement.
+
+        With where, only the files matching it are written, the others are
+        selected as they are: a no-op must not bump updated_at, the keyset of the
+        pagination, nor notify the caches.
+
+        Returns:
+            The updated files, then the unchanged ones, the others are not found
+        """
+        query = update(File).where(any_of(File.id, ids), File.user_id == user_id)
+        if where is not None:
+            query = query.where(where)
+
+        files = list(
+            await self.session.scalars(
+                query.values(values)
+                .returning(File)
+                .execution_options(populate_existing=True)
+            )
+        )
+
+        if where is not None and len(files) < len(set(ids)):
+            updated = {file.id for file in files}
+            files += [
+                file
+                for file in await self.session.scalars(
+                    select(File).where(any_of(File.id, ids), File.user_id == user_id)
+                )
+                if file.id not in updated
+            ]
 
         if commit:
-            self.session.commit()
+            await self.session.commit()
 
-        return file
+        return files
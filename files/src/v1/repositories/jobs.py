@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Repository
+from ...models import Job
+
+
+class JobRepository(Repository):
+    def __init__(self, session: AsyncSession | None = None):
+        super().__init__(session)
+
+    def enqueue_many(self, kind: str, payloads: list[dict]) -> None:
+        """
+        Add jobs to the transaction of the session, inserted in one statement.
+        They are visible to the workers once committed.
+        """
+        self.session.add_all(
+            [Job(kind=kind, payload=payload, attempts=0) for payload in payloads]
+        )
+
+    async def claim(self) -> Job | None:
+        """
+        Lock the next due job, skipping the jobs locked by other workers. The job
+        stays locked until the transaction ends, and is claimed again if the
+        worker dies.
+        """
+        return await self.session.scalar(
+            select(Job)
+            .where(Job.failed_at.is_(None), Job.run_at <= func.now())
+            .order_by(Job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+
+    async def complete(self, job: Job) -> None:
+        await self.session.delete(job)
+
+    async def retry(self, job: Job, error: str, delay: float) -> None:
+        job.attempts += 1
+        job.last_error = error
+        job.run_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+    async def fail(self, job: Job, error: str) -> None:
+        job.attempts += 1
+        job.last_error = error
+        job.failed_at = func.now()
@@ -0,0 +1,105 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import Repository, any_of
+from ...models import UploadSession
+
+
+class UploadSessionRepository(Repository):
+    def __init__(self, session: AsyncSession | None = None):
+        super().__init__(session)
+
+    async def get_by_id_and_user_id(
+        self, id: UUID, user_id: UUID, for_update: bool = False
+    ) -> UploadSession | None:
+        """
+        Unexpired session of the user. With for_update the row is locked until
+        the transaction ends and read again, so a session is only completed once.
+        """
+        query = select(UploadSession).where(
+            UploadSession.id == id,
+            UploadSession.user_id == user_id,
+            UploadSession.expires_at > datetime.now().astimezone(),
+        )
+        if for_update:
+            query = query.with_for_update().execution_options(populate_existing=True)
+
+        return await self.session.scalar(query)
+
+    async def create(
+        self,
+        user_id: UUID,
+        filename: str,
+        size_bytes: int,
+        chunk_size: int,
+        expires_at: datetime,
+        extra: dict | None = None,
+        commit: bool = True,
+    ) -> UploadSession:
+        upload_session = UploadSession(
+            user_id=user_id,
+            filename=filename,
+            size_bytes=size_bytes,
+            chunk_size=chunk_size,
+            expires_at=expires_at,
+            extra=extra,
+        )
+
+        self.session.add(upload_session)
+
+        if commit:
+            await self.session.commit()
+
+        return upload_session
+
+    async def delete(self, upload_session: UploadSession, commit: bool = True) -> None:
+        await self.session.delete(upload_session)
+
+        if commit:
+            await self.session.commit()
+
+    async def reset_completing(
+        self, id: UUID, completing_at: datetime, commit: bool = True
+    ) -> None:
+        """
+        Allow the session to be completed again, unless another completion took
+        it over meanwhile.
+        """
+        await self.session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == id, UploadSession.completing_at == completing_at)
+            .values(completing_at=None)
+        )
+
+        if commit:
+            await self.session.commit()
+
+    async def delete_expired(self, now: datetime, commit: bool = True) -> list[UUID]:
+        """
+        Returns:
+            The ids of the deleted sessions
+        """
+        ids = await self.session.scalars(
+            delete(UploadSession)
+            .where(UploadSession.expires_at <= now)
+            .returning(UploadSession.id)
+        )
+        ids = list(ids)
+
+        if commit:
+            await self.session.commit()
+
+        return ids
+
+    async def get_ids(self, ids: list[UUID]) -> set[UUID]:
+        """
+        The ids of the given sessions that still exist.
+        """
+        return set(
+            await self.session.scalars(
+                select(UploadSession.id).where(any_of(UploadSession.id, ids))
+            )
+        )
@@ -6,6 +6,8 @@ from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict, field_serializer
 
+from .errors import Error
+
 
 class File(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -17,6 +19,7 @@ class File(BaseModel):
     size_bytes: int
     extension: str
     extra: Any | None
+    sha256: str | None = None
 
     created_at: datetime
     updated_at: datetime
@@ -27,6 +30,38 @@ class File(BaseModel):
         return int(value.timestamp()) if value is not None else None
 
 
+def file_row_to_json(row: Any) -> dict[str, Any]:
+    """
+    The JSON of File for a row of the files table, built directly: the row comes
+    from the database, so validating it through File only costs time on large
+    pages. Must stay in step with File, field order included.
+    """
+    deleted_at = row.deleted_at
+
+    return {
+        "id": str(row.id),
+        "user_id": str(row.user_id),
+        "filename": row.filename,
+        "path": row.path,
+        "size_bytes": row.size_bytes,
+        "extension": row.extension,
+        "extra": row.extra,
+        "sha256": row.sha256,
+        "created_at": int(row.created_at.timestamp()),
+        "updated_at": int(row.updated_at.timestamp()),
+        "deleted_at": int(deleted_at.timestamp()) if deleted_at is not None else None,
+    }
+
+
+class FileCreateResult(BaseModel):
+    """
+    Either the created file or the error of one file of a batch.
+    """
+
+    file: File | None = None
+    error: Error | None = None
+
+
 class LocalFileCreateRequest(BaseModel):
     path: str
     filename: str | None = None
@@ -42,17 +77,22 @@ class FileListRequest(BaseModel):
     page_size: int = 10
     order_by: Literal["created_at", "updated_at"] = "updated_at"
     order: Literal["asc", "desc"] = "desc"
+    # Continue after the `next_cursor` of a previous page, `page` is ignored
+    cursor: str | None = None
+    # Exact count, estimate from the planner statistics, or skip counting
+    total: Literal["exact", "estimated", "none"] = "exact"
 
 
 class FileListResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
-    total: int
-    pages: int
-    page: int
+    total: int | None
+    pages: int | None
+    page: int | None
     page_size: int
     items: list[File]
+    next_cursor: str | None = None
 
 
 class FileBatchGetItem(BaseModel):
@@ -70,6 +110,24 @@ class FileBatchGetResponse(BaseModel):
     items: list[File]
 
 
+class FileBatchRequest(BaseModel):
+    ids: list[UUID]
+
+
+class FileBatchResult(BaseModel):
+    """
+    Either the changed file or the error of one id of a batch.
+    """
+
+    id: UUID
+    file: File | None = None
+    error: Error | None = None
+
+
+class FileBatchResponse(BaseModel):
+    items: list[FileBatchResult]
+
+
 class FileDetailsRequest(BaseModel):
     ids: list[UUID]
 
@@ -80,7 +138,7 @@ class FileDetailsResponse(BaseModel):
 
 class AuthorizationContext(BaseModel):
 
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
     base_id: UUID | None = None
     folder_id: UUID | None = None
@@ -0,0 +1,19 @@
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class PermissionInvalidateRequest(BaseModel):
+    """
+    Cached permission decisions matching every given field are dropped.
+    """
+
+    user_id: UUID | None = None
+    file_id: UUID | None = None
+    base_id: UUID | None = None
+    folder_id: UUID | None = None
+    attachment_id: UUID | None = None
+
+
+class PermissionInvalidateResponse(BaseModel):
+    invalidated: int
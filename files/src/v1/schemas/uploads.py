@@ -0,0 +1,35 @@
+import math
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict, Field, computed_field, field_serializer
+
+
+class UploadSessionCreateRequest(BaseModel):
+    filename: str
+    size_bytes: int = Field(ge=0)
+    extra: Any | None = None
+
+
+class UploadSession(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    filename: str
+    size_bytes: int
+    chunk_size: int
+    # Indexes of the chunks received so far
+    received: list[int] = []
+
+    created_at: datetime
+    expires_at: datetime
+
+    @computed_field
+    @property
+    def chunk_count(self) -> int:
+        return math.ceil(self.size_bytes / self.chunk_size)
+
+    @field_serializer("created_at", "expires_at")
+    def serialize_datetime(self, value: datetime) -> int:
+        return int(value.timestamp())
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from ..exceptions.services import StorageBusy
+from ...config import FilesConfig
+
+T = TypeVar("T")
+
+
+class IOExecutor:
+    """
+    Bounded threads for the blocking calls of one storage volume, separate from
+    the threadpool of Starlette so a slow disk does not hold up other requests.
+    At most max_queue calls wait for a thread, further calls are rejected.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix=f"io-{name}")
+        self._lock = threading.Lock()
+
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def run(self, func: Callable[..., T], *args, bounded: bool = True) -> T:
+        """
+        Calls that are not bounded (clean ups) are queued even when it is full.
+
+        Raises:
+            StorageBusy: if the queue of the volume is full
+        """
+        if bounded and self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise StorageBusy(self.name)
+
+        submitted = time.monotonic()
+
+        def call():
+            wait = time.monotonic() - submitted
+            with self._lock:
+                self.running += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": max(self.pending - self.running, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / self.completed if self.completed else None,
+            "wait_max": self.wait_max,
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class IOExecutors:
+    """
+    An IOExecutor per configured volume, chosen by the longest matching mount
+    point of a path.
+    """
+
+    def __init__(self, config: FilesConfig):
+        self.default = IOExecutor("default", config.io_workers, config.io_max_queue)
+        self.volumes = {
+            os.path.abspath(path): IOExecutor(path, workers, config.io_max_queue)
+            for path, workers in config.io_volumes.items()
+        }
+
+    def get(self, path: str | os.PathLike) -> IOExecutor:
+        path = os.path.abspath(path)
+        for volume in sorted(self.volumes, key=len, reverse=True):
+            if path == volume or path.startswith(volume.rstrip("/") + "/"):
+                return self.volumes[volume]
+
+        return self.default
+
+    def stats(self) -> dict:
+        return {
+            executor.name: executor.stats()
+            for executor in [self.default, *self.volumes.values()]
+        }
+
+    def shutdown(self) -> None:
+        for executor in [self.default, *self.volumes.values()]:
+            executor.shutdown()
+
+
+io_executors = IOExecutors(FilesConfig())
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+from uuid import UUID
+
+import psycopg
+from loguru import logger
+
+from ..schemas.files import File
+from ... import models
+from ...cache import MISSING, TTLCache
+from ...config import FileCacheConfig
+
+# Notified with "<file id> <epoch>" for every updated or deleted file, see the
+# files_changed trigger
+CHANNEL = "files_changed"
+
+
+class FileCache:
+    """
+    File metadata by id, with negative entries for the missing ids.
+
+    Entries are invalidated by the notifications of the database, so every worker
+    and node sees a change once it is committed. Notifications sent while not
+    listening are lost, so the cache is bypassed until the listener is connected
+    and cleared when it connects.
+    """
+
+    def __init__(self, config: FileCacheConfig):
+        self.config = config
+        self.cache = TTLCache(max_size=config.max_size)
+        self.listening = False
+        # Incremented by every invalidation, a value loaded before is not cached
+        self.generation = 0
+        self.invalidations = 0
+        self.reconnects = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    async def get_or_load(
+        self, id: UUID, load: Callable[[], Awaitable[models.File | None]]
+    ) -> File | None:
+        """
+        Returns:
+            The cached file, or the file loaded and cached, None if missing
+        """
+        if self.listening and (file := self.cache.get(id)) is not MISSING:
+            return file
+
+        generation = self.generation
+        file = await load()
+        if file is not None:
+            file = File.model_validate(file)
+
+        if self.listening and generation == self.generation:
+            ttl = self.config.ttl if file is not None else self.config.missing_ttl
+            self.cache.set(id, file, ttl=ttl)
+
+        return file
+
+    def invalidate(self, *ids: UUID) -> None:
+        """
+        Drop the entries changed by this worker, without waiting for the
+        notifications.
+        """
+        self.generation += 1
+        for id in ids:
+            self.cache.invalidate(id)
+
+    async def listen(self, conninfo: str) -> None:
+        """
+        Invalidate the notified entries until cancelled, reconnecting after a
+        failure.
+        """
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {CHANNEL}")
+                    self.cache.clear()
+                    self.generation += 1
+                    self.listening = True
+
+                    async for notify in connection.notifies():
+                        self.on_notify(notify.payload)
+            except Exception as e:
+                logger.warning("File cache listener disconnected: {}", e)
+            finally:
+                self.listening = False
+
+            self.reconnects += 1
+            await asyncio.sleep(self.config.reconnect_delay)
+
+    def on_notify(self, payload: str) -> None:
+        id, changed_at = payload.split(" ")
+        lag = max(time.time() - float(changed_at), 0)
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        self.invalidations += 1
+
+        self.invalidate(UUID(id))
+
+    def stats(self) -> dict[str, Any]:
+        """
+        The lag is the time from a change to its notification, how long another
+        worker may serve the old metadata.
+        """
+        return {
+            **self.cache.stats(),
+            "listening": self.listening,
+            "invalidations": self.invalidations,
+            "reconnects": self.reconnects,
+            "lag_avg": (
+                self.lag_total / self.invalidations if self.invalidations else None
+            ),
+            "lag_max": self.lag_max,
+        }
+
+
+# Shared by the requests of the worker
+file_cache = FileCache(FileCacheConfig())
@@ -1,29 +1,56 @@
+import asyncio
+import json
+from collections import Counter
+from collections.abc import AsyncIterator
+from functools import partial
 from pathlib import Path
 from uuid import UUID
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .file_cache import file_cache
 from .storage import LocalStorageService
+from .uploads import MultipartUpload
+from ..exceptions import ErrorRegistry
 from ..exceptions.files import (
     FileNotExists,
     FileNotFound,
     FileTooLarge,
     FiletypeNotAllowed,
+    InvalidJSONContent,
 )
+from ..repositories.blobs import BlobRepository
 from ..repositories.files import FileRepository
+from ..repositories.jobs import JobRepository
+from ..schemas.errors import Error
 from ..schemas.files import (
     AuthorizationContext,
     File,
     FileBatchGet,
-    FileBatchGetResponse,
+    FileBatchRequest,
+    FileBatchResponse,
+    FileBatchResult,
+    FileCreateResult,
     FileDetailsRequest,
     FileDetailsResponse,
     FileListRequest,
-    FileListResponse,
     FileUpdateRequest,
     LocalFileCreateRequest,
+    file_row_to_json,
 )
 from ..services.permissions import PermissionService
+from ... import models
 from ...config import FilesConfig
 
+# Job removing the content of a deleted file, see FileService.delete_content
+DELETE_CONTENT_JOB = "delete_content"
+
+
+def to_error(e: Exception) -> Error:
+    meta = ErrorRegistry.get_meta_by_class(e)
+
+    return Error(code=meta.code, message=str(e), details=getattr(e, "details", None))
+
 
 class FileService:
     def __init__(
@@ -38,113 +65,275 @@ class FileService:
         self.storage = storage
         self.permission_service = permission_service
 
-    def get(self, id: UUID) -> File:
-        with self.repo as repo:
-            try:
-                file = repo.get(id)
+    async def get(self, id: UUID) -> File:
+        file = await file_cache.get_or_load(id, partial(self.load, id))
+        if file is None:
+            raise FileNotFound(id)
 
-                return File.model_validate(file)
+        return file
+
+    async def get_authorized(
+        self,
+        id: UUID,
+        user_id: UUID,
+        context: AuthorizationContext | None = None,
+    ) -> File:
+        """
+        Load the file if the user owns it, or the Bases service allows access to it
+        as an attachment in the context. The file is served from the cache when
+        possible, ownership is checked on the loaded file.
+
+        Raises:
+            FileNotFound: if the file does not exist or the user is not allowed
+        """
+        file = await file_cache.get_or_load(id, partial(self.load, id))
+
+        if file is not None and file.user_id != user_id:
+            if context is None or not (
+                await self.permission_service.check_attachment_permission(
+                    file_id=id, user_id=user_id, context=context
+                )
+            ):
+                file = None
+
+        if file is None:
+            raise FileNotFound(file_id=id, user_id=user_id)
+
+        return file
+
+    async def load(self, id: UUID) -> models.File | None:
+        async with self.repo as repo:
+            try:
+                return await repo.get(id)
             except FileNotExists:
-                raise FileNotFound(id)
+                return None
 
-    def get_by_user_id_page_paginated(
+    async def get_by_user_id_page_paginated(
         self, data: FileListRequest, user_id: UUID
-    ) -> FileListResponse:
-        with self.repo as repo:
-            paginated = repo.get_by_user_id_page_paginated(
+    ) -> dict:
+        """
+        Returns:
+            The JSON of FileListResponse, serialized from plain rows
+        """
+        async with self.repo as repo:
+            paginated = await repo.get_by_user_id_page_paginated(
                 user_id=user_id,
                 page=data.page,
                 page_size=data.page_size,
                 order_by=data.order_by,
                 order=data.order,
+                cursor=data.cursor,
+                total=data.total,
+                rows=True,
             )
 
-            return FileListResponse.model_validate(paginated)
+        return {
+            "total": paginated.total,
+            "pages": paginated.pages,
+            "page": paginated.page,
+            "page_size": paginated.page_size,
+            "items": [file_row_to_json(row) for row in paginated.items],
+            "next_cursor": paginated.next_cursor,
+        }
 
-    def get_by_ids(
+    async def get_by_ids(
         self, data: FileDetailsRequest, user_id: UUID
     ) -> FileDetailsResponse:
-        with self.repo as repo:
-            files = repo.get_by_ids_and_user_id(ids=data.ids, user_id=user_id)
+        async with self.repo as repo:
+            files = await repo.get_by_ids_and_user_id(ids=data.ids, user_id=user_id)
 
             return FileDetailsResponse(items=files)
 
-    def batch_get(self, data: FileBatchGet, user_id: UUID) -> FileBatchGetResponse:
-        with self.repo as repo:
-            files = repo.get_by_ids(ids=[item.file_id for item in data.items])
-            files_dict = {file.id: file for file in files}
-            allowed_files = []
-
-            for item in data.items:
-                file = files_dict.get(item.file_id)
-                if file is None:
-                    continue
-
-                # 根据是否有 attachment_id 执行不同的权限检查
-                has_permission = False
-                if item.attachment_id:
-                    context = AuthorizationContext(
+    async def batch_get(self, data: FileBatchGet, user_id: UUID) -> dict:
+        """
+        Ownership of every item is settled by the single query loading the files,
+        only the items of other users with an attachment context go to Bases.
+
+        Returns:
+            The JSON of FileBatchGetResponse, serialized from plain rows
+        """
+        async with self.repo as repo:
+            files = await repo.get_by_ids(
+                ids=[item.file_id for item in data.items], rows=True
+            )
+
+        files_dict = {file.id: file for file in files}
+        attachments = {
+            index: item
+            for index, item in enumerate(data.items)
+            if item.attachment_id
+            and item.file_id in files_dict
+            and files_dict[item.file_id].user_id != user_id
+        }
+        allowed = await self.permission_service.check_attachment_permissions(
+            user_id=user_id,
+            checks=[
+                (
+                    item.file_id,
+                    AuthorizationContext(
                         base_id=item.base_id,
                         folder_id=item.folder_id,
                         attachment_id=item.attachment_id,
-                    )
-                    has_permission = (
-                        self.permission_service.check_file_permission_with_context(
-                            file_id=file.id, user_id=user_id, context=context
-                        )
-                    )
-                else:
-                    has_permission = self.permission_service.check_file_permission(
-                        file_id=file.id, user_id=user_id
-                    )
+                    ),
+                )
+                for item in attachments.values()
+            ],
+        )
+        allowed_indexes = {index for index, ok in zip(attachments, allowed) if ok}
 
-                if has_permission:
-                    allowed_files.append(file)
+        allowed_files = []
+        for index, item in enumerate(data.items):
+            file = files_dict.get(item.file_id)
+            if file is None:
+                continue
 
-            return FileBatchGetResponse(items=allowed_files)
+            if file.user_id == user_id or index in allowed_indexes:
+                allowed_files.append(file)
 
-    def create_from_local(self, data: LocalFileCreateRequest, user_id: UUID) -> File:
-        with self.repo as repo:
-            path = Path(data.path)
+        return {"items": [file_row_to_json(file) for file in allowed_files]}
 
-            self.validate_size(size_bytes=path.stat().st_size)
-            self.validate_extension(extension=path.suffix)
-            if data.filename:
-                self.validate_extension(extension=Path(data.filename).suffix)
+    async def create_many_from_local(
+        self,
+        data: list[LocalFileCreateRequest],
+        user_id: UUID,
+        atomic: bool = True,
+    ) -> list[FileCreateResult]:
+        """
+        Create the files in one INSERT, the paths are stat'ed concurrently.
+        Unless atomic, the files that are too large or not allowed are skipped.
 
-            file = repo.create(
+        Raises:
+            FileTooLarge: if atomic and a file is over the limit
+            FiletypeNotAllowed: if atomic and a file extension is not allowed
+        """
+        sizes = await asyncio.gather(
+            *(self.storage.get_size(Path(item.path)) for item in data)
+        )
+
+        results = {}
+        values = {}
+        for index, (item, size_bytes) in enumerate(zip(data, sizes)):
+            path = Path(item.path)
+            try:
+                self.validate_size(size_bytes=size_bytes)
+                self.validate_extension(extension=path.suffix)
+                if item.filename:
+                    self.validate_extension(extension=Path(item.filename).suffix)
+            except (FileTooLarge, FiletypeNotAllowed) as e:
+                if atomic:
+                    raise
+                results[index] = FileCreateResult(error=to_error(e))
+                continue
+
+            values[index] = dict(
                 path=path,
                 user_id=user_id,
-                filename=data.filename or path.name,
-                extra=data.extra,
+                filename=item.filename or path.name,
+                extra=item.extra,
+                size_bytes=size_bytes,
             )
 
-            return File.model_validate(file)
+        async with self.repo as repo:
+            files = await repo.create_many(list(values.values()))
+
+        for index, file in zip(values, files):
+            results[index] = FileCreateResult(file=File.model_validate(file))
 
-    def create_from_binary(
+        return [results[index] for index in range(len(data))]
+
+    async def create_from_multipart(
         self,
-        bytes: bytes,
-        filename: str,
-        size_bytes: int,
+        stream: AsyncIterator[bytes],
+        content_type: str,
+        content_length: int | None,
         user_id: UUID,
-        extra: dict | None = None,
-    ) -> File:
-        with self.repo as repo:
-            # Validate if allowed
-            self.validate_size(size_bytes=size_bytes)
-            self.validate_extension(extension=Path(filename).suffix)
-            # Generate a new filename and save to storage
-            path = self.storage.get_path(filename, user_id)
-            self.storage.save_binary(bytes, path)
-            # Create the file in the database
-            file = repo.create(
-                path=path,
-                user_id=user_id,
-                filename=filename,
-                extra=extra,
-            )
+        atomic: bool = True,
+    ) -> list[FileCreateResult]:
+        """
+        Stream the uploaded files of a multipart/form-data body to storage and
+        create them in one INSERT. If atomic nothing is kept if any file fails,
+        otherwise the files that are too large or not allowed are skipped.
+
+        Raises:
+            FileTooLarge: if Content-Length or the body is over the limit, or if
+                atomic and a file is over the limit
+            FiletypeNotAllowed: if atomic and a file extension is not allowed
+            InvalidJSONContent: if extra is not valid JSON
+            InvalidMultipartContent: if the body is not valid multipart/form-data
+        """
+        if not content_type.startswith("multipart/form-data"):
+            return []
+
+        if content_length is not None and content_length > self.config.max_request_size:
+            raise FileTooLarge(self.config.max_request_size, content_length)
+
+        upload = MultipartUpload(
+            config=self.config,
+            storage=self.storage,
+            user_id=user_id,
+            validate_extension=self.validate_extension,
+            atomic=atomic,
+        )
+        parts = await upload.parse(stream, content_type)
+
+        try:
+            extra = upload.fields.get("extra")
+            if extra:
+                try:
+                    extra = json.loads(extra)
+                except json.JSONDecodeError as e:
+                    raise InvalidJSONContent(details=e.msg)
+
+            async with self.repo as repo:
+                values = [
+                    dict(
+                        path=await self.store(
+                            repo, part.path, part.sha256, part.size_bytes
+                        ),
+                        user_id=user_id,
+                        filename=part.filename,
+                        extra=extra,
+                        sha256=part.sha256,
+                        extension=Path(part.filename).suffix,
+                        size_bytes=part.size_bytes,
+                    )
+                    for part in parts
+                ]
+                files = await repo.create_many(values)
+        except BaseException:
+            await upload.discard()
+            raise
+
+        results = {
+            index: FileCreateResult(error=to_error(e))
+            for index, e in upload.errors.items()
+        }
+        for part, file in zip(parts, files):
+            results[part.index] = FileCreateResult(file=File.model_validate(file))
+
+        return [results[index] for index in range(upload.file_count)]
+
+    async def store(
+        self, repo: FileRepository, path: Path, sha256: str, size_bytes: int
+    ) -> Path:
+        """
+        With dedup enabled, reference the blob of this content instead of keeping
+        the written copy. A blob moved into place is kept if the transaction
+        rolls back, it has the same content the next upload would store.
+
+        Returns:
+            The path to create the file with
+        """
+        if not self.storage.dedup:
+            return path
+
+        blob_path, created = await BlobRepository(repo.session).acquire(
+            sha256=sha256,
+            path=str(self.storage.get_blob_path(sha256)),
+            size_bytes=size_bytes,
+        )
 
-            return File.model_validate(file)
+        return await self.storage.store_blob(path, Path(blob_path), created)
 
     def validate_size(self, size_bytes: int) -> None:
         if size_bytes > self.config.max_file_size:
@@ -155,41 +344,169 @@ class FileService:
         if extension not in self.config.allowed_extensions:
             raise FiletypeNotAllowed(extension, self.config.allowed_extensions)
 
-    def update(self, id: UUID, data: FileUpdateRequest) -> File:
-        with self.repo as repo:
-            file = repo.update(id, extra=data.extra)
+    async def update(self, id: UUID, user_id: UUID, data: FileUpdateRequest) -> File:
+        """
+        Replace the extra of a file of the user, authorized by the UPDATE itself.
 
-            return File.model_validate(file)
+        Raises:
+            FileNotFound: if the file does not exist or the user does not own it
+        """
+        async with self.repo as repo:
+            file = await repo.update(id, user_id, extra=data.extra)
+
+        file_cache.invalidate(id)
+
+        return self.to_file(file, id, user_id)
 
-    def delete(self, id: UUID) -> None:
+    async def patch(self, id: UUID, user_id: UUID, data: FileUpdateRequest) -> File:
         """
-        Delete a file record from the database.
+        Merge patch (RFC 7396) the extra of a file of the user.
+
+        Raises:
+            FileNotFound: if the file does not exist or the user does not own it
         """
-        with self.repo as repo:
-            file = repo.get(id)
+        async with self.repo as repo:
+            file = await repo.patch(id, user_id, extra=data.extra)
 
-            repo.delete(id, commit=False)
+        file_cache.invalidate(id)
 
-            self.storage.delete(Path(file.path))
+        return self.to_file(file, id, user_id)
 
-            repo.commit()
+    async def delete(self, file: File) -> None:
+        """
+        Delete a file record from the database. Its content, unless it is a blob
+        still referenced by other files, is removed by a job enqueued in the same
+        transaction.
+        """
+        await self.delete_many([file.id], user_id=file.user_id)
+
+    async def batch_delete(
+        self, data: FileBatchRequest, user_id: UUID
+    ) -> FileBatchResponse:
+        files = await self.delete_many(data.ids, user_id=user_id)
 
-            return
+        return self.to_batch_response(data.ids, files, user_id)
 
-    def soft_delete(self, id: UUID) -> File:
+    async def delete_many(self, ids: list[UUID], user_id: UUID) -> list[models.File]:
+        """
+        Delete the files of the user in one statement, their blob references are
+        released per blob and their content removal is enqueued in the same
+        transaction.
+
+        Returns:
+            The deleted files
+        """
+        async with self.repo as repo:
+            files = await repo.delete_by_ids_and_user_id(ids, user_id)
+
+            blobs = BlobRepository(repo.session)
+            payloads = []
+            for (path, sha256), count in Counter(
+                (file.path, file.sha256) for file in files
+            ).items():
+                released = None
+                if sha256:
+                    released = await blobs.release(sha256, path, count)
+                if released is not False:
+                    payloads.append(
+                        {"path": path, "sha256": sha256 if released else None}
+                    )
+
+            JobRepository(repo.session).enqueue_many(DELETE_CONTENT_JOB, payloads)
+            await repo.commit()
+
+        file_cache.invalidate(*ids)
+
+        return files
+
+    async def batch_soft_delete(
+        self, data: FileBatchRequest, user_id: UUID
+    ) -> FileBatchResponse:
+        async with self.repo as repo:
+            files = await repo.soft_delete_by_ids_and_user_id(data.ids, user_id)
+
+        file_cache.invalidate(*data.ids)
+
+        return self.to_batch_response(data.ids, files, user_id)
+
+    async def batch_restore(
+        self, data: FileBatchRequest, user_id: UUID
+    ) -> FileBatchResponse:
+        async with self.repo as repo:
+            files = await repo.restore_by_ids_and_user_id(data.ids, user_id)
+
+        file_cache.invalidate(*data.ids)
+
+        return self.to_batch_response(data.ids, files, user_id)
+
+    @staticmethod
+    def to_batch_response(
+        ids: list[UUID], files: list[models.File], user_id: UUID
+    ) -> FileBatchResponse:
+        """
+        Result of each id in request order, FileNotFound for the ids that are not
+        files of the user.
+        """
+        files_dict = {file.id: File.model_validate(file) for file in files}
+
+        return FileBatchResponse(
+            items=[
+                (
+                    FileBatchResult(id=id, file=files_dict[id])
+                    if id in files_dict
+                    else FileBatchResult(
+                        id=id, error=to_error(FileNotFound(file_id=id, user_id=user_id))
+                    )
+                )
+                for id in ids
+            ]
+        )
+
+    async def delete_content(self, session: AsyncSession, payload: dict) -> None:
+        """
+        Job removing the content of a deleted file. A released blob is only
+        removed if no upload created it again meanwhile, holding it until the
+        job commits.
+        """
+        if payload["sha256"]:
+            blobs = BlobRepository(session)
+            if not await blobs.lock_absent(payload["sha256"], payload["path"]):
+                return
+            await blobs.remove(payload["path"])
+
+        await self.storage.delete(Path(payload["path"]))
+
+    async def soft_delete(self, id: UUID, user_id: UUID) -> File:
         """
         Mark a file as deleted in the database.
+
+        Raises:
+            FileNotFound: if the file does not exist or the user does not own it
         """
-        with self.repo as repo:
-            file = repo.soft_delete(id)
+        async with self.repo as repo:
+            file = await repo.soft_delete(id, user_id)
 
-            return File.model_validate(file)
+        file_cache.invalidate(id)
 
-    def restore(self, id: UUID) -> File:
+        return self.to_file(file, id, user_id)
+
+    async def restore(self, id: UUID, user_id: UUID) -> File:
         """
         Mark a file as restored in the database.
+
+        Raises:
+            FileNotFound: if the file does not exist or the user does not own it
         """
-        with self.repo as repo:
-            file = repo.restore(id)
+        async with self.repo as repo:
+            file = await repo.restore(id, user_id)
+
+        file_cache.invalidate(id)
+
+        return self.to_file(file, id, user_id)
+
+    @staticmethod
+    def to_file(file: models.File | None, id: UUID, user_id: UUID) -> File:
+        if file is None:
+            raise FileNotFound(file_id=id, user_id=user_id)
 
-            return File.model_validate(file)
+        return File.model_validate(file)
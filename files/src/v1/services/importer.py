@@ -0,0 +1,267 @@
+import asyncio
+import errno
+import fcntl
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from uuid import UUID, uuid4, uuid5
+
+from .storage import LocalStorageService, copy_file
+from ..repositories.files import FileRepository
+from ...config import FilesConfig
+
+# ioctl cloning the extents of a file on btrfs, xfs (reflink=1), ...
+FICLONE = 0x40049409
+
+
+def reflink(source: Path, target: Path) -> None:
+    """
+    Clone the file without copying its data, or copy it in the kernel if the
+    filesystem can not. The target appears complete or not at all.
+    """
+    temp_path = target.with_name(f".{target.name}.{uuid4().hex}.part")
+    try:
+        with open(source, "rb") as src, open(temp_path, "xb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                copy_file(source, dst.fileno())
+        os.link(temp_path, target)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def hardlink(source: Path, target: Path) -> None:
+    """
+    Hard link the file, or copy it across filesystems.
+    """
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        reflink(source, target)
+
+
+class ImportService:
+    """
+    Registers the files of a local directory tree for a user.
+
+    Directories are scanned in parallel threads, each file is stat'ed once and
+    filtered by the allowed extensions and the max file size, the rows are loaded
+    in batches with COPY. The directories of each committed batch are appended to
+    the checkpoint file, they are skipped when the import is run again.
+
+    In register mode the files stay where they are. Otherwise they are hard
+    linked, reflinked or moved into the storage of the user just before their
+    batch is loaded, and the links of a batch that fails are removed. A move
+    links (or copies) first and removes the source after the batch is committed.
+
+    The id and the stored name of a file derive from its source path, size and
+    mtime, so running an interrupted import again finds the links it already
+    made and the COPY skips the rows it already committed.
+    """
+
+    def __init__(
+        self,
+        config: FilesConfig,
+        repo: FileRepository,
+        storage: LocalStorageService,
+        user_id: UUID,
+        checkpoint: Path,
+        mode: str = "register",
+        workers: int = 8,
+        batch_size: int = 10000,
+    ):
+        self.config = config
+        self.repo = repo
+        self.storage = storage
+        self.user_id = user_id
+        self.checkpoint = checkpoint
+        self.mode = mode
+        self.workers = workers
+        self.batch_size = batch_size
+
+        self.allowed_extensions = set(config.allowed_extensions)
+        self.max_file_size = config.max_file_size
+
+    async def run(self, directory: Path) -> dict[str, int]:
+        """
+        Returns:
+            The number of directories scanned, files imported and skipped, and
+            the bytes imported
+        """
+        stats = {"directories": 0, "imported": 0, "skipped": 0, "bytes": 0}
+        done = self.read_checkpoint()
+        loop = asyncio.get_running_loop()
+
+        queue = deque([directory.absolute()])
+        scanning = set()
+        rows, directories, sources = [], [], []
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while queue or scanning:
+                while queue and len(scanning) < self.workers:
+                    path = queue.popleft()
+                    scanning.add(
+                        loop.run_in_executor(pool, self.scan, path, str(path) in done)
+                    )
+
+                finished, scanning = await asyncio.wait(
+                    scanning, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in finished:
+                    path, subdirectories, scanned, skipped = future.result()
+                    queue.extend(subdirectories)
+                    stats["directories"] += 1
+                    stats["skipped"] += skipped
+
+                    if str(path) in done:
+                        continue
+
+                    directories.append(path)
+                    for row, source in scanned:
+                        rows.append(row)
+                        sources.append(source)
+                        stats["bytes"] += row[4]
+
+                if len(rows) >= self.batch_size:
+                    await self.flush(pool, rows, directories, sources)
+                    stats["imported"] += len(rows)
+                    rows, directories, sources = [], [], []
+
+            await self.flush(pool, rows, directories, sources)
+            stats["imported"] += len(rows)
+
+        return stats
+
+    def scan(self, directory: Path, done: bool) -> tuple:
+        """
+        List a directory, and stat and filter its files unless done. Blocking,
+        runs in a worker thread.
+        """
+        subdirectories, scanned, skipped = [], [], 0
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(Path(entry.path))
+                    continue
+                if done or not entry.is_file(follow_symlinks=False):
+                    continue
+
+                path = Path(entry.path)
+                stat = entry.stat(follow_symlinks=False)
+                size_bytes = stat.st_size
+                extension = path.suffix.lstrip(".")
+                if (
+                    extension not in self.allowed_extensions
+                    or size_bytes > self.max_file_size
+                ):
+                    skipped += 1
+                    continue
+
+                id = uuid5(self.user_id, f"{path}:{size_bytes}:{stat.st_mtime_ns}")
+                scanned.append(
+                    (
+                        (
+                            id,
+                            self.user_id,
+                            path.name,
+                            str(self.get_target(id, path)),
+                            size_bytes,
+                            extension,
+                        ),
+                        path,
+                    )
+                )
+
+        return directory, subdirectories, scanned, skipped
+
+    def get_target(self, id: UUID, path: Path) -> Path:
+        """
+        Returns:
+            The path of the file to register
+        """
+        if self.mode == "register":
+            return path
+
+        return self.storage.get_layout_path(
+            f"{id}{path.suffix}", self.user_id
+        ).absolute()
+
+    def ingest(self, source: Path, target: Path) -> bool:
+        """
+        Link or copy the source to its target. Blocking, runs in a worker thread.
+
+        Returns:
+            Whether the target was created, it is otherwise left from an
+            interrupted run of the import
+        """
+        self.storage.ensure_directory(target.parent)
+
+        try:
+            if self.mode == "reflink":
+                reflink(source, target)
+            else:
+                hardlink(source, target)
+        except FileExistsError:
+            return False
+
+        return True
+
+    async def flush(
+        self,
+        pool: ThreadPoolExecutor,
+        rows: list[tuple],
+        directories: list[Path],
+        sources: list[Path],
+    ) -> None:
+        """
+        Ingest and load a batch, then remove the moved sources and append its
+        directories to the checkpoint. An interruption before the checkpoint is
+        written leaves the directories to be scanned again.
+        """
+        loop = asyncio.get_running_loop()
+        created = []
+
+        try:
+            if self.mode != "register":
+                results = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(pool, self.ingest, source, Path(row[3]))
+                        for row, source in zip(rows, sources)
+                    ),
+                    return_exceptions=True,
+                )
+                created = [
+                    Path(row[3]) for row, result in zip(rows, results) if result is True
+                ]
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+
+            async with self.repo as repo:
+                await repo.copy(rows)
+        except BaseException:
+            # Should the commit have succeeded regardless, running the import
+            # again links the files anew
+            for path in created:
+                path.unlink(missing_ok=True)
+            raise
+
+        if self.mode == "move":
+            for source in sources:
+                source.unlink(missing_ok=True)
+
+        with open(self.checkpoint, "a") as f:
+            f.writelines(f"{directory}\n" for directory in directories)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_checkpoint(self) -> set[str]:
+        if not self.checkpoint.exists():
+            return set()
+
+        return set(self.checkpoint.read_text().splitlines())
@@ -1,11 +1,31 @@
+from functools import partial
 from uuid import UUID
 
+from .file_cache import file_cache
+from ..exceptions.files import FileNotExists
 from ..repositories.files import FileRepository
+from ..schemas.files import File
+from ... import models
 
 
 class FileInternalService:
     def __init__(self, repo: FileRepository):
         self.repo = repo
 
-    def get(self, id: UUID):
-        return self.repo.get(id)
+    async def get(self, id: UUID) -> File:
+        """
+        Raises:
+            FileNotExists: if the file does not exist
+        """
+        file = await file_cache.get_or_load(id, partial(self.load, id))
+        if file is None:
+            raise FileNotExists(id)
+
+        return file
+
+    async def load(self, id: UUID) -> models.File | None:
+        async with self.repo as repo:
+            try:
+                return await repo.get(id)
+            except FileNotExists:
+                return None
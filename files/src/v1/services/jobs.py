@@ -0,0 +1,74 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..repositories.jobs import JobRepository
+from ...config import JobConfig
+
+# Runs a job in the transaction that claimed it, raises to retry it later
+Handler = Callable[[AsyncSession, dict], Awaitable[None]]
+
+
+class JobService:
+    """
+    Runs the queued jobs. Each job runs in the transaction that locked it, its
+    own changes in a savepoint, so a failure rolls them back but still records
+    the attempt. Handlers must be idempotent, a job is run again if the worker
+    dies before commit.
+    """
+
+    def __init__(
+        self, config: JobConfig, repo: JobRepository, handlers: dict[str, Handler]
+    ):
+        self.config = config
+        self.repo = repo
+        self.handlers = handlers
+        self.stats = {"completed": 0, "retried": 0, "failed": 0}
+
+    async def run_once(self) -> bool:
+        """
+        Returns:
+            Whether a job was due
+        """
+        async with self.repo as repo:
+            job = await repo.claim()
+            if job is None:
+                await repo.session.rollback()
+                return False
+
+            try:
+                async with repo.session.begin_nested():
+                    await self.handlers[job.kind](repo.session, job.payload)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if job.attempts + 1 >= self.config.max_attempts:
+                    logger.error("Job {} {} failed: {}", job.kind, job.id, error)
+                    await repo.fail(job, error)
+                    self.stats["failed"] += 1
+                else:
+                    delay = min(
+                        self.config.backoff * 2**job.attempts, self.config.max_backoff
+                    )
+                    logger.warning(
+                        "Job {} {} retried in {}s: {}", job.kind, job.id, delay, error
+                    )
+                    await repo.retry(job, error, delay)
+                    self.stats["retried"] += 1
+            else:
+                await repo.complete(job)
+                self.stats["completed"] += 1
+
+            await repo.commit()
+
+        return True
+
+    async def run(self) -> None:
+        """
+        Run jobs one at a time until cancelled, polling when the queue is empty.
+        Run several services, each with its own repository, for concurrency.
+        """
+        while True:
+            if not await self.run_once():
+                await asyncio.sleep(self.config.poll_interval)
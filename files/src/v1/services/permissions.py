@@ -1,40 +1,140 @@
+from typing import NamedTuple
 from uuid import UUID
 
 from ..clients.bases import BasesClient, PermissionCheck
-from ..repositories.permissions import PermissionRepository
 from ..schemas.files import AuthorizationContext
+from ...cache import MISSING, TTLCache
+from ...config import PermissionCacheConfig
 
+permission_cache_config = PermissionCacheConfig()
 
-class PermissionService:
-    def __init__(self, repo: PermissionRepository):
-        self.repo = repo
 
-    def check_file_permission(self, file_id: UUID, user_id: UUID) -> bool:
+class PermissionKey(NamedTuple):
+    user_id: UUID
+    file_id: UUID
+    base_id: UUID | None
+    folder_id: UUID | None
+    attachment_id: UUID
+
 
-        with self.repo as repo:
-            if repo.check_file_permission(user_id=user_id, file_id=file_id):
-                return True
+# Bases decisions, shared by the requests of the worker
+permission_cache = TTLCache(max_size=permission_cache_config.max_size)
 
-        return False
 
-    def check_file_permission_with_context(
+class PermissionService:
+    async def check_attachment_permission(
         self, file_id: UUID, user_id: UUID, context: AuthorizationContext
     ) -> bool:
-        with self.repo as repo:
-            if repo.check_file_permission(user_id=user_id, file_id=file_id):
-                return True
+        """
+        Check with the Bases service if the user can access the file as an attachment.
+        Decisions are cached.
+        """
+        key = permission_key(file_id, user_id=user_id, context=context)
+        if (allowed := permission_cache.get(key)) is not MISSING:
+            return allowed
+
+        client = BasesClient()
+        allowed = bool(
+            await client.check_permissions(
+                user_id=user_id,
+                data=attachment_check(file_id, user_id=user_id, context=context),
+            )
+        )
+        cache_decision(key, allowed)
+
+        return allowed
 
+    async def check_attachment_permissions(
+        self, user_id: UUID, checks: list[tuple[UUID, AuthorizationContext]]
+    ) -> list[bool]:
+        """
+        Check many (file_id, context) pairs in one Bases round-trip, identical or
+        cached checks are not sent. Returns the decisions in the order of the checks.
+        """
+        results = {}
+        for file_id, context in checks:
+            key = permission_key(file_id, user_id=user_id, context=context)
+            if (allowed := permission_cache.get(key)) is not MISSING:
+                results[(file_id, context)] = allowed
+
+        unique = [check for check in dict.fromkeys(checks) if check not in results]
         client = BasesClient()
-        if client.check_permissions(
+        decisions = await client.check_permissions_batch(
             user_id=user_id,
-            data=PermissionCheck(
-                principal_id=user_id,
-                base_id=context.base_id,
-                folder_id=context.folder_id,
-                attachment_id=context.attachment_id,
-                object_id=file_id,
-            ),
-        ):
-            return True
-
-        return False
+            checks=[
+                attachment_check(file_id, user_id=user_id, context=context)
+                for file_id, context in unique
+            ],
+        )
+        for (file_id, context), allowed in zip(unique, decisions, strict=True):
+            key = permission_key(file_id, user_id=user_id, context=context)
+            cache_decision(key, allowed)
+            results[(file_id, context)] = allowed
+
+        return [results[check] for check in checks]
+
+    def invalidate_permissions(
+        self,
+        user_id: UUID | None = None,
+        file_id: UUID | None = None,
+        base_id: UUID | None = None,
+        folder_id: UUID | None = None,
+        attachment_id: UUID | None = None,
+    ) -> int:
+        """
+        Drop the cached decisions matching every given field, all when none is given.
+        Returns how many were dropped.
+        """
+        fields = {
+            name: value
+            for name, value in {
+                "user_id": user_id,
+                "file_id": file_id,
+                "base_id": base_id,
+                "folder_id": folder_id,
+                "attachment_id": attachment_id,
+            }.items()
+            if value is not None
+        }
+
+        return permission_cache.invalidate_where(
+            lambda key: all(
+                getattr(key, name) == value for name, value in fields.items()
+            )
+        )
+
+
+def permission_key(
+    file_id: UUID, user_id: UUID, context: AuthorizationContext
+) -> PermissionKey:
+    return PermissionKey(
+        user_id=user_id,
+        file_id=file_id,
+        base_id=context.base_id,
+        folder_id=context.folder_id,
+        attachment_id=context.attachment_id,
+    )
+
+
+def cache_decision(key: PermissionKey, allowed: bool) -> None:
+    permission_cache.set(
+        key,
+        allowed,
+        ttl=(
+            permission_cache_config.allow_ttl
+            if allowed
+            else permission_cache_config.deny_ttl
+        ),
+    )
+
+
+def attachment_check(
+    file_id: UUID, user_id: UUID, context: AuthorizationContext
+) -> PermissionCheck:
+    return PermissionCheck(
+        principal_id=user_id,
+        base_id=context.base_id,
+        folder_id=context.folder_id,
+        attachment_id=context.attachment_id,
+        object_id=file_id,
+    )
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator
+
+from .storage import LocalStorageService
+from ..repositories.blobs import BlobRepository
+from ..repositories.files import FileRepository
+
+# Managed by the upload sessions garbage collector
+EXCLUDED = {".uploads"}
+
+
+class RateLimiter:
+    """
+    Token bucket of rate operations per second, a rate of 0 is unlimited.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def acquire(self, n: int = 1) -> None:
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= n
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class ReconcileService:
+    """
+    Finds the stored files without a row (orphans) and the rows without a file
+    (missing), e.g. left by a crash between a delete of the row and its file.
+
+    The storage is walked in parallel threads but yielded in path order, and
+    merged with the rows streamed in the same order, so the memory does not grow
+    with the number of files. Files modified within the grace period are not
+    orphans, they may belong to an upload in progress.
+
+    Repairing removes the orphans and soft deletes the rows of missing files,
+    each after checking again.
+    """
+
+    def __init__(
+        self,
+        repo: FileRepository,
+        repair_repo: FileRepository,
+        storage: LocalStorageService,
+        workers: int = 8,
+        rate: float = 0,
+        grace: float = 3600,
+    ):
+        # The rows are streamed in a transaction of repo, repairs are committed
+        # with repair_repo
+        self.repo = repo
+        self.repair_repo = repair_repo
+        self.storage = storage
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.grace = grace
+
+        self.root = Path(storage.base_path).absolute()
+
+    async def run(self, repair: bool = False) -> dict[str, int]:
+        """
+        Returns:
+            The number of files and rows scanned, orphans and missing found, and
+            repaired
+        """
+        stats = {"files": 0, "rows": 0, "orphans": 0, "missing": 0, "repaired": 0}
+        prefix = f"{self.root}/"
+        cutoff = time.time() - self.grace
+        missing = []
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            loop = asyncio.get_running_loop()
+            files = self.walk(pool, loop.run_in_executor(pool, self.scan, self.root))
+
+            async with self.repo as repo:
+                rows = repo.stream_by_path(f"{os.getcwd()}/")
+                file = await anext(files, None)
+                row = await anext(rows, None)
+
+                while file is not None or row is not None:
+                    if row is not None and not row[1].startswith(prefix):
+                        # Created from a path outside the storage
+                        stats["rows"] += 1
+                        await self.limiter.acquire()
+                        if not await loop.run_in_executor(pool, os.path.exists, row[1]):
+                            missing.append(row)
+                        row = await anext(rows, None)
+                    elif file is None or (row is not None and row[1] < file[0]):
+                        stats["rows"] += 1
+                        missing.append(row)
+                        row = await anext(rows, None)
+                    elif row is None or file[0] < row[1]:
+                        stats["files"] += 1
+                        if file[1] < cutoff:
+                            stats["orphans"] += 1
+                            print(f"orphan {file[0]}")
+                            if repair and await self.remove_orphan(file[0]):
+                                stats["repaired"] += 1
+                        file = await anext(files, None)
+                    else:
+                        # Deduplicated files share a path
+                        while row is not None and row[1] == file[0]:
+                            stats["rows"] += 1
+                            row = await anext(rows, None)
+                        stats["files"] += 1
+                        file = await anext(files, None)
+
+                    if len(missing) >= 1000:
+                        stats["missing"] += len(missing)
+                        stats["repaired"] += await self.report_missing(missing, repair)
+                        missing = []
+
+            stats["missing"] += len(missing)
+            stats["repaired"] += await self.report_missing(missing, repair)
+
+        return stats
+
+    def scan(self, directory: Path) -> list[tuple[str, bool, float]]:
+        """
+        Entries of a directory as (path, is directory, mtime), sorted so that a
+        depth first walk yields the paths in byte order. Blocking, runs in a
+        worker thread.
+        """
+        entries = []
+
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if directory != self.root or entry.name not in EXCLUDED:
+                        entries.append((f"{entry.path}/", True, 0))
+                elif entry.is_file(follow_symlinks=False):
+                    entries.append(
+                        (entry.path, False, entry.stat(follow_symlinks=False).st_mtime)
+                    )
+
+        entries.sort()
+
+        return entries
+
+    async def walk(
+        self, pool: ThreadPoolExecutor, listing: Future
+    ) -> AsyncIterator[tuple[str, float]]:
+        """
+        Yields the (path, mtime) of the files in byte order of the path. Up to
+        workers subdirectories are listed ahead in the pool while the files before
+        them are yielded, the next one is submitted as one is consumed, so the
+        listings held stay bounded by the depth of the tree.
+        """
+        entries = await listing
+        await self.limiter.acquire(len(entries))
+        loop = asyncio.get_running_loop()
+
+        directories = deque(path for path, is_directory, _ in entries if is_directory)
+        listings = deque()
+
+        def prefetch():
+            while directories and len(listings) < self.workers:
+                listings.append(
+                    loop.run_in_executor(pool, self.scan, Path(directories.popleft()))
+                )
+
+        prefetch()
+        for path, is_directory, mtime in entries:
+            if is_directory:
+                # Directories are consumed in the order they were submitted
+                subdirectory = listings.popleft()
+                prefetch()
+                async for file in self.walk(pool, subdirectory):
+                    yield file
+            else:
+                yield path, mtime
+
+    async def remove_orphan(self, path: str) -> bool:
+        """
+        Returns:
+            Whether the file was removed, False if a row references it now
+        """
+        await self.limiter.acquire()
+
+        async with self.repair_repo as repo:
+            # Locks the blob row, if any, until the file is removed
+            await BlobRepository(repo.session).remove(path)
+            if await repo.exists_path(path):
+                await repo.session.rollback()
+                return False
+
+            await self.storage.delete(Path(path))
+            await repo.commit()
+
+        return True
+
+    async def report_missing(self, rows: list[tuple], repair: bool) -> int:
+        """
+        Returns:
+            The number of rows soft deleted
+        """
+        for id, path, deleted_at in rows:
+            print(f"missing {id} {path}{' (deleted)' if deleted_at else ''}")
+
+        if not repair:
+            return 0
+
+        ids = []
+        for id, path, deleted_at in rows:
+            if deleted_at is None:
+                await self.limiter.acquire()
+                if not await self.storage.run(Path(path), os.path.exists, path):
+                    ids.append(id)
+
+        async with self.repair_repo as repo:
+            await repo.soft_delete_by_ids(ids)
+
+        return len(ids)
@@ -0,0 +1,139 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from .storage import LocalStorageService
+from ..repositories.files import FileRepository
+from ...models import File
+
+
+class RelayoutService:
+    """
+    Moves the stored files to the configured layout while the service runs.
+
+    A file is hard linked at its new path, the row is updated, then the old path
+    is unlinked, so it is readable at every step. The row is only updated if its
+    path did not change meanwhile, otherwise the new link is removed instead.
+    Files already in place are skipped, so an interrupted run is resumed by
+    running it again.
+    """
+
+    def __init__(
+        self,
+        repo: FileRepository,
+        storage: LocalStorageService,
+        workers: int = 8,
+        batch_size: int = 1000,
+    ):
+        self.repo = repo
+        self.storage = storage
+        self.workers = workers
+        self.batch_size = batch_size
+
+    async def run(self, dry_run: bool = False) -> dict[str, int]:
+        """
+        Returns:
+            The number of files scanned, moved, and skipped because they are
+            missing, another file is in the way, or their row changed meanwhile
+        """
+        stats = {
+            "scanned": 0,
+            "moved": 0,
+            "missing": 0,
+            "conflicts": 0,
+            "changed": 0,
+        }
+        loop = asyncio.get_running_loop()
+        after = None
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while True:
+                async with self.repo as repo:
+                    files = await repo.get_after_id(after, self.batch_size)
+                if not files:
+                    break
+
+                after = files[-1].id
+                stats["scanned"] += len(files)
+                moves = [
+                    (file.id, file.path, str(target))
+                    for file in files
+                    if (target := self.get_target(file)) and str(target) != file.path
+                ]
+                if dry_run:
+                    stats["moved"] += len(moves)
+                    continue
+
+                linked = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(pool, self.link, Path(old), Path(new))
+                        for _, old, new in moves
+                    )
+                )
+                moves = [move for move, ok in zip(moves, linked) if ok]
+                for ok in linked:
+                    if ok is None:
+                        stats["missing"] += 1
+                    elif ok is False:
+                        stats["conflicts"] += 1
+
+                async with self.repo as repo:
+                    moved = set(await repo.update_paths(moves))
+                    # The new link of a row that changed is removed, unless the
+                    # row points to it now (e.g. moved by a concurrent run)
+                    unused = [
+                        new
+                        for id, _, new in moves
+                        if id not in moved and not await repo.exists_path(new)
+                    ]
+
+                await asyncio.gather(
+                    *(
+                        loop.run_in_executor(
+                            pool, partial(Path(path).unlink, missing_ok=True)
+                        )
+                        for path in [old for id, old, _ in moves if id in moved]
+                        + unused
+                    )
+                )
+                stats["moved"] += len(moved)
+                stats["changed"] += len(moves) - len(moved)
+
+        return stats
+
+    def get_target(self, file: File) -> Path | None:
+        """
+        Path of the file in the configured layout, None for the files not in a
+        user directory (blobs, files created from a local path).
+        """
+        path = Path(file.path)
+        user_directory = Path(self.storage.base_path).absolute() / str(file.user_id)
+        if not path.is_relative_to(user_directory):
+            return None
+
+        try:
+            target = self.storage.get_layout_path(path.name, file.user_id)
+        except ValueError:
+            return None
+
+        return target.absolute()
+
+    def link(self, old: Path, new: Path) -> bool | None:
+        """
+        Returns:
+            Whether the file is available at the new path, None if it is missing
+        """
+        self.storage.ensure_directory(new.parent)
+
+        try:
+            os.link(old, new)
+        except FileExistsError:
+            # Linked by an interrupted run
+            return os.path.samefile(old, new)
+        except FileNotFoundError:
+            # Moved by an interrupted run that did not update the row
+            return True if new.exists() else None
+
+        return True
@@ -0,0 +1,88 @@
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from .files import DELETE_CONTENT_JOB
+from .reconcile import RateLimiter
+from ..repositories.blobs import BlobRepository
+from ..repositories.files import FileRepository
+from ..repositories.jobs import JobRepository
+from ...config import FilesConfig
+
+
+class RetentionService:
+    """
+    Purges the files soft deleted more than RETENTION_DAYS ago.
+
+    Each batch deletes its rows with DELETE ... RETURNING, skipping the rows
+    locked by a concurrent purger, releases their blobs and enqueues the removal
+    of their content in the same transaction, like FileService.delete_many. The
+    batches are rate limited after commit, so the workers removing the files
+    spare the disks.
+    """
+
+    def __init__(
+        self,
+        config: FilesConfig,
+        repo: FileRepository,
+        batch_size: int = 1000,
+        rate: float = 0,
+    ):
+        self.retention_days = config.retention_days
+        self.repo = repo
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+
+    async def run(self) -> dict[str, int | float]:
+        """
+        Returns:
+            The number of batches, rows deleted, removals enqueued, blobs still
+            referenced, bytes released and the duration in seconds
+        """
+        stats = {
+            "batches": 0,
+            "rows": 0,
+            "enqueued": 0,
+            "referenced": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
+        started = time.monotonic()
+        before = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+
+        while True:
+            async with self.repo as repo:
+                files = await repo.purge(before, self.batch_size)
+                if not files:
+                    break
+
+                # A blob is released once per purged reference, its row stays
+                # locked until commit so no upload can reference it meanwhile
+                blobs = BlobRepository(repo.session)
+                payloads = []
+                for (path, sha256), count in Counter(
+                    (path, sha256) for path, sha256, _ in files
+                ).items():
+                    released = None
+                    if sha256:
+                        released = await blobs.release(sha256, path, count)
+                    if released is False:
+                        stats["referenced"] += 1
+                    else:
+                        payloads.append(
+                            {"path": path, "sha256": sha256 if released else None}
+                        )
+
+                JobRepository(repo.session).enqueue_many(DELETE_CONTENT_JOB, payloads)
+                await repo.commit()
+
+            stats["batches"] += 1
+            stats["rows"] += len(files)
+            stats["enqueued"] += len(payloads)
+            stats["bytes"] += sum(size_bytes for _, _, size_bytes in files)
+
+            await self.limiter.acquire(len(payloads))
+
+        stats["seconds"] = round(time.monotonic() - started, 3)
+
+        return stats
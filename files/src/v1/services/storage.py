@@ -1,32 +1,274 @@
+import asyncio
+import errno
+import hashlib
+import os
 import shutil
+from functools import partial
 from pathlib import Path
+from typing import BinaryIO, Callable, TypeVar
 from uuid import UUID, uuid4
 
+from .executor import IOExecutor, IOExecutors, io_executors
 from ...config import FilesConfig
 
+T = TypeVar("T")
+
+# Writes are buffered up to this size, each flush is one call in the executor
+# running while the next buffer fills
+BUFFER_SIZE = 1024 * 1024
+
+
+class StorageWriter:
+    """
+    Writes a file next to its final path and renames it on commit, so a partial
+    file is never visible under the final name. The content is hashed while it
+    is written.
+    """
+
+    def __init__(self, path: Path, executor: IOExecutor):
+        self.path = path
+        self.executor = executor
+        # Unique, a retried write never trips over the leftover of a crashed one
+        self.temp_path = path.with_name(f".{path.name}.{uuid4().hex}.part")
+        self.size_bytes = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file: BinaryIO | None = None
+        self._flushing: asyncio.Future | None = None
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    async def open(self) -> "StorageWriter":
+        self._file = await self.executor.run(open, self.temp_path, "xb")
+
+        return self
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.size_bytes += len(data)
+
+        if len(self._buffer) >= BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Start writing the buffer once the previous flush is done, writes stay in
+        order and at most two buffers are held.
+        """
+        await self.wait_flushed()
+
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            self._flushing = asyncio.ensure_future(self.executor.run(self._write, data))
+
+    async def wait_flushed(self) -> None:
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+
+    async def commit(self) -> Path:
+        await self.flush()
+        await self.wait_flushed()
+        await self.executor.run(self._commit)
+
+        return self.path
+
+    async def abort(self) -> None:
+        try:
+            await self.wait_flushed()
+        except Exception:
+            pass
+        await self.executor.run(self._abort, bounded=False)
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        # hashlib releases the GIL for large inputs
+        self._hash.update(data)
+
+    def _commit(self) -> None:
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+
+    def _abort(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+def copy_file(source: Path, fd: int) -> int:
+    """
+    Append the source file to fd in the kernel, with copy_file_range (which may
+    share the extents on reflink capable filesystems) or sendfile.
+
+    Returns:
+        The number of bytes copied
+    """
+    with open(source, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        use_sendfile = False
+
+        while offset < size:
+            if not use_sendfile:
+                try:
+                    copied = os.copy_file_range(
+                        f.fileno(), fd, size - offset, offset_src=offset
+                    )
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                        raise
+                    use_sendfile = True
+                    continue
+            else:
+                copied = os.sendfile(fd, f.fileno(), offset, size - offset)
+
+            if copied == 0:
+                break
+            offset += copied
+
+    return offset
+
+
+# Directories known to exist, saves a stat (and mkdir) per upload. Directories
+# are never removed by the service.
+known_directories: set[Path] = set()
+
+
+def assemble_files(sources: list[Path], path: Path) -> tuple[int, str]:
+    """
+    Concatenate the sources into path without copying through Python, the
+    result is hashed in one read afterwards.
+    """
+    temp_path = path.with_name(f".{path.name}.{uuid4().hex}.part")
+    try:
+        with open(temp_path, "xb") as f:
+            size_bytes = sum(copy_file(source, f.fileno()) for source in sources)
+        with open(temp_path, "rb") as f:
+            sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    return size_bytes, sha256
+
+
+def list_directories(directory: Path) -> list[Path]:
+    if not directory.exists():
+        return []
+
+    return [path for path in directory.iterdir() if path.is_dir()]
+
 
 class LocalStorageService:
-    def __init__(self, config: FilesConfig):
+    """
+    Every blocking filesystem call runs in the bounded executor of the volume of
+    its path.
+    """
+
+    def __init__(self, config: FilesConfig, executors: IOExecutors = io_executors):
         self.base_path = config.base_path
+        self.dedup = config.dedup
+        self.layout = config.layout
+        self.executors = executors
+
+    async def run(
+        self, path: Path, func: Callable[..., T], *args, bounded: bool = True
+    ) -> T:
+        return await self.executors.get(path).run(func, *args, bounded=bounded)
 
-    def get_path(self, filename: str, user_id: UUID) -> Path:
+    async def get_path(self, filename: str, user_id: UUID) -> Path:
         """
         Rename file to uuid and save it in the user's directory.
         """
-        # TODO: due to performance issues, consider split to subdirectories by prefix
+        filename = f"{uuid4()}{Path(filename).suffix}"
+        path = self.get_layout_path(filename, user_id)
+        if path.parent not in known_directories:
+            await self.run(path, self.ensure_directory, path.parent)
+
+        return path
+
+    def get_layout_path(self, filename: str, user_id: UUID) -> Path:
+        """
+        Path of a stored file (named <uuid><suffix>) in the configured layout.
+        """
         directory = Path(self.base_path) / str(user_id)
-        if not directory.exists():
-            directory.mkdir(parents=True)
 
-        file_uuid = uuid4()
-        filename = f"{file_uuid}{Path(filename).suffix}"
+        if self.layout == "sharded":
+            digits = UUID(Path(filename).stem).hex
+            directory = directory / digits[:2] / digits[2:4]
 
         return directory / filename
 
-    def save_binary(self, data: bytes, path: Path):
-        with open(path, "wb") as f:
-            shutil.copyfileobj(data, f)
+    def ensure_directory(self, directory: Path) -> None:
+        """
+        Blocking, call it in an executor.
+        """
+        if directory not in known_directories:
+            directory.mkdir(parents=True, exist_ok=True)
+            known_directories.add(directory)
+
+    async def open_writer(self, path: Path) -> StorageWriter:
+        return await StorageWriter(path, self.executors.get(path)).open()
+
+    async def get_size(self, path: Path) -> int:
+        return (await self.run(path, os.stat, path)).st_size
+
+    def get_upload_path(self, session_id: UUID) -> Path:
+        """
+        Directory of the chunks of an upload session, on the same filesystem as
+        the files so assembling them can be a kernel copy.
+        """
+        return Path(self.base_path) / ".uploads" / str(session_id)
+
+    async def create_directory(self, path: Path) -> None:
+        await self.run(path, partial(path.mkdir, parents=True))
+
+    async def list_chunks(self, directory: Path) -> set[int]:
+        """
+        Indexes of the chunks written to the directory.
+        """
+        names = await self.run(directory, os.listdir, directory)
+
+        return {int(name) for name in names if name.isdigit()}
+
+    async def list_uploads(self) -> list[Path]:
+        directory = Path(self.base_path) / ".uploads"
+
+        return await self.run(directory, list_directories, directory)
+
+    async def assemble(self, sources: list[Path], path: Path) -> tuple[int, str]:
+        """
+        Returns:
+            The size and the SHA-256 hex digest of the file
+        """
+        return await self.run(path, assemble_files, sources, path)
+
+    async def delete_directory(self, path: Path):
+        await self.run(path, partial(shutil.rmtree, path, ignore_errors=True))
+
+    def get_blob_path(self, sha256: str) -> Path:
+        """
+        Path of the content addressed blob, split by the leading hex digits.
+        """
+        return Path(self.base_path) / "blobs" / sha256[:2] / sha256[2:4] / sha256
+
+    async def store_blob(self, path: Path, blob_path: Path, created: bool) -> Path:
+        """
+        Move a written file to its blob, or drop it if the blob already exists.
+        """
+        if created:
+            await self.run(blob_path, self.move_to, path, blob_path)
+        else:
+            await self.delete(path)
+
+        return blob_path
+
+    def move_to(self, path: Path, target: Path) -> None:
+        self.ensure_directory(target.parent)
+        os.replace(path, target)
 
-    def delete(self, path: Path):
-        if path.exists():
-            path.unlink()
+    async def delete(self, path: Path):
+        await self.run(path, partial(path.unlink, missing_ok=True), bounded=False)
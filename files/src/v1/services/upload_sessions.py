@@ -0,0 +1,287 @@
+import math
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import UUID
+
+from .files import FileService
+from .storage import LocalStorageService
+from ..exceptions.uploads import (
+    InvalidChunk,
+    UploadCompleting,
+    UploadIncomplete,
+    UploadSessionNotFound,
+)
+from ..repositories.upload_sessions import UploadSessionRepository
+from ..schemas.files import File
+from ..schemas.uploads import UploadSession, UploadSessionCreateRequest
+from ... import models
+from ...config import FilesConfig
+
+# Assembling the largest file takes seconds, a completion still marked after
+# this is left over from a request that did not finish
+COMPLETING_TIMEOUT = timedelta(minutes=10)
+
+
+class UploadSessionService:
+    """
+    Resumable uploads: a session is created for the file, its chunks are PUT in
+    any order (and in parallel), then the session is completed into a File.
+    """
+
+    def __init__(
+        self,
+        config: FilesConfig,
+        repo: UploadSessionRepository,
+        storage: LocalStorageService,
+        file_service: FileService,
+    ):
+        self.config = config
+        self.repo = repo
+        self.storage = storage
+        self.file_service = file_service
+
+    async def create(
+        self, data: UploadSessionCreateRequest, user_id: UUID
+    ) -> UploadSession:
+        """
+        Raises:
+            FileTooLarge: if the file is over the limit
+            FiletypeNotAllowed: if the file extension is not allowed
+        """
+        self.file_service.validate_size(size_bytes=data.size_bytes)
+        self.file_service.validate_extension(extension=Path(data.filename).suffix)
+
+        async with self.repo as repo:
+            upload_session = await repo.create(
+                user_id=user_id,
+                filename=data.filename,
+                size_bytes=data.size_bytes,
+                chunk_size=self.config.upload_chunk_size,
+                expires_at=datetime.now().astimezone()
+                + timedelta(seconds=self.config.upload_session_ttl),
+                extra=data.extra,
+            )
+
+        await self.storage.create_directory(
+            self.storage.get_upload_path(upload_session.id)
+        )
+
+        return UploadSession.model_validate(upload_session)
+
+    async def get(self, id: UUID, user_id: UUID) -> UploadSession:
+        """
+        Raises:
+            UploadSessionNotFound: if the session does not exist or has expired
+        """
+        async with self.repo as repo:
+            upload_session = await self.get_session(repo, id, user_id)
+
+        return UploadSession.model_validate(upload_session).model_copy(
+            update={
+                "received": sorted(
+                    await self.storage.list_chunks(self.storage.get_upload_path(id))
+                )
+            }
+        )
+
+    async def put_chunk(
+        self, id: UUID, index: int, stream: AsyncIterator[bytes], user_id: UUID
+    ) -> None:
+        """
+        Write a chunk, a chunk sent again replaces the previous one.
+
+        Raises:
+            UploadSessionNotFound: if the session does not exist or has expired
+            UploadCompleting: if the session is being completed
+            InvalidChunk: if the index is out of range or the size is not exact
+        """
+        async with self.repo as repo:
+            upload_session = await self.get_session(repo, id, user_id)
+            self.check_not_completing(upload_session)
+            # Release the connection before the body is streamed
+            await repo.commit()
+
+        expected_size = self.get_chunk_size(upload_session, index)
+        writer = await self.storage.open_writer(
+            self.storage.get_upload_path(id) / str(index)
+        )
+        try:
+            async for data in stream:
+                if writer.size_bytes + len(data) > expected_size:
+                    raise InvalidChunk(
+                        index, expected_size, writer.size_bytes + len(data)
+                    )
+                await writer.write(data)
+
+            if writer.size_bytes != expected_size:
+                raise InvalidChunk(index, expected_size, writer.size_bytes)
+            await writer.commit()
+        except BaseException:
+            await writer.abort()
+            raise
+
+    async def complete(self, id: UUID, user_id: UUID) -> File:
+        """
+        Assemble the chunks into the file and create it. The session is marked
+        completing and committed first, the chunks are assembled without holding
+        a connection, then the file is created in a short second transaction.
+
+        Raises:
+            UploadSessionNotFound: if the session does not exist or has expired
+            UploadIncomplete: if some chunks have not been received
+            UploadCompleting: if the session is being completed by another request
+        """
+        directory = self.storage.get_upload_path(id)
+
+        async with self.repo as repo:
+            upload_session = await self.get_session(repo, id, user_id, for_update=True)
+            self.check_not_completing(upload_session)
+
+            chunk_count = math.ceil(
+                upload_session.size_bytes / upload_session.chunk_size
+            )
+            received = await self.storage.list_chunks(directory)
+            if missing := [i for i in range(chunk_count) if i not in received]:
+                raise UploadIncomplete(missing)
+
+            completing_at = datetime.now().astimezone()
+            upload_session.completing_at = completing_at
+            filename, extra = upload_session.filename, upload_session.extra
+
+        path = await self.storage.get_path(filename, user_id)
+        stored = None
+        try:
+            size_bytes, sha256 = await self.storage.assemble(
+                [directory / str(i) for i in range(chunk_count)], path
+            )
+
+            async with self.repo as repo:
+                upload_session = await self.get_session(
+                    repo, id, user_id, for_update=True
+                )
+                # Taken over by another request after COMPLETING_TIMEOUT
+                if upload_session.completing_at != completing_at:
+                    raise UploadCompleting(id)
+
+                stored = await self.file_service.store(
+                    self.file_service.repo, path, sha256, size_bytes
+                )
+                file = await self.file_service.repo.create(
+                    path=stored,
+                    user_id=user_id,
+                    filename=filename,
+                    extra=extra,
+                    commit=False,
+                    sha256=sha256,
+                    extension=Path(filename).suffix,
+                    size_bytes=size_bytes,
+                )
+                await repo.delete(upload_session, commit=False)
+        except BaseException:
+            await self.storage.delete(path)
+            async with self.repo as repo:
+                # A blob created by this upload was kept by the rollback, it is
+                # only removed if no other file acquired it meanwhile
+                if stored is not None and stored != path:
+                    await self.file_service.delete_content(
+                        repo.session, {"path": str(stored), "sha256": sha256}
+                    )
+                await repo.reset_completing(id, completing_at, commit=False)
+            raise
+
+        await self.storage.delete_directory(directory)
+
+        return File.model_validate(file)
+
+    async def delete(self, id: UUID, user_id: UUID) -> None:
+        """
+        Abort the upload and drop its chunks.
+
+        Raises:
+            UploadSessionNotFound: if the session does not exist or has expired
+            UploadCompleting: if the session is being completed
+        """
+        async with self.repo as repo:
+            upload_session = await self.get_session(repo, id, user_id, for_update=True)
+            self.check_not_completing(upload_session)
+            await repo.delete(upload_session)
+
+        await self.storage.delete_directory(self.storage.get_upload_path(id))
+
+    async def collect_garbage(self) -> tuple[int, int]:
+        """
+        Drop the expired sessions, and the chunk directories left without one.
+
+        Returns:
+            The number of expired sessions and orphan directories removed
+        """
+        async with self.repo as repo:
+            expired = await repo.delete_expired(datetime.now().astimezone())
+
+        for id in expired:
+            await self.storage.delete_directory(self.storage.get_upload_path(id))
+
+        # A directory is only created after its session is committed, and only
+        # removed after it is deleted
+        directories = {}
+        for path in await self.storage.list_uploads():
+            try:
+                directories[UUID(path.name)] = path
+            except ValueError:
+                continue
+
+        async with self.repo as repo:
+            existing = await repo.get_ids(list(directories))
+
+        orphans = [path for id, path in directories.items() if id not in existing]
+        for path in orphans:
+            await self.storage.delete_directory(path)
+
+        return len(expired), len(orphans)
+
+    async def get_session(
+        self,
+        repo: UploadSessionRepository,
+        id: UUID,
+        user_id: UUID,
+        for_update: bool = False,
+    ) -> models.UploadSession:
+        upload_session = await repo.get_by_id_and_user_id(
+            id, user_id, for_update=for_update
+        )
+        if upload_session is None:
+            raise UploadSessionNotFound(id)
+
+        return upload_session
+
+    def check_not_completing(self, upload_session: models.UploadSession) -> None:
+        """
+        A completion that has not finished within COMPLETING_TIMEOUT is taken to
+        have died with its request, the session can be completed again.
+
+        Raises:
+            UploadCompleting: if the session is being completed
+        """
+        if (
+            upload_session.completing_at is not None
+            and upload_session.completing_at
+            > datetime.now().astimezone() - COMPLETING_TIMEOUT
+        ):
+            raise UploadCompleting(upload_session.id)
+
+    def get_chunk_size(self, upload_session: models.UploadSession, index: int) -> int:
+        """
+        Every chunk is chunk_size bytes, except the last one.
+
+        Raises:
+            InvalidChunk: if the index is out of range
+        """
+        chunk_count = math.ceil(upload_session.size_bytes / upload_session.chunk_size)
+        if not 0 <= index < chunk_count:
+            raise InvalidChunk(index, None)
+
+        if index == chunk_count - 1:
+            return upload_session.size_bytes - index * upload_session.chunk_size
+
+        return upload_session.chunk_size
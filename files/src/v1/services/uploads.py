@@ -0,0 +1,247 @@
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Callable
+from uuid import UUID
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from .storage import LocalStorageService, StorageWriter
+from ..exceptions.files import (
+    FileTooLarge,
+    FiletypeNotAllowed,
+    InvalidMultipartContent,
+)
+from ...config import FilesConfig
+
+# Form fields other than files are kept in memory, "extra" is the only one used
+MAX_FIELD_SIZE = 1024 * 1024
+
+
+class UploadedPart:
+    def __init__(
+        self, index: int, filename: str, path: Path, size_bytes: int, sha256: str
+    ):
+        # Position among the files of the request
+        self.index = index
+        self.filename = filename
+        self.path = path
+        self.size_bytes = size_bytes
+        self.sha256 = sha256
+
+
+class MultipartUpload:
+    """
+    Parses a multipart/form-data stream and writes every "files" part straight to
+    its storage path while it arrives, the body is never buffered as a whole.
+
+    The parser callbacks only record events, they are handled after each chunk
+    is fed to the parser.
+
+    Unless atomic, a file that is too large or not allowed is skipped and its
+    error kept in errors, instead of failing the upload.
+    """
+
+    def __init__(
+        self,
+        config: FilesConfig,
+        storage: LocalStorageService,
+        user_id: UUID,
+        validate_extension: Callable[[str], None],
+        atomic: bool = True,
+    ):
+        self.config = config
+        self.storage = storage
+        self.user_id = user_id
+        self.validate_extension = validate_extension
+        self.atomic = atomic
+
+        self.parts: list[UploadedPart] = []
+        self.errors: dict[int, Exception] = {}
+        self.fields: dict[str, str] = {}
+        self.file_count = 0
+
+        self._events: list[tuple[str, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._field_name: str | None = None
+        self._field_data = bytearray()
+        self._writer: StorageWriter | None = None
+        self._filename: str | None = None
+        self._skipping = False
+        self._received = 0
+        self._finished = False
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._events.append(("data", data[start:end]))
+
+    def on_part_end(self) -> None:
+        self._events.append(("end", b""))
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        self._events.append(("headers", self._headers.get(b"content-disposition", b"")))
+
+    def on_end(self) -> None:
+        self._finished = True
+
+    async def parse(
+        self, stream: AsyncIterator[bytes], content_type: str
+    ) -> list[UploadedPart]:
+        """
+        Raises:
+            InvalidMultipartContent: if the body is not valid multipart/form-data
+            FileTooLarge: as soon as a file or the whole request is over the limit
+            FiletypeNotAllowed: as soon as a part with a disallowed extension begins
+        """
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise InvalidMultipartContent("Missing boundary")
+
+        parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+                "on_end": self.on_end,
+            },
+        )
+
+        try:
+            async for chunk in stream:
+                self._received += len(chunk)
+                if self._received > self.config.max_request_size:
+                    raise FileTooLarge(self.config.max_request_size, self._received)
+
+                try:
+                    parser.write(chunk)
+                except Exception as e:
+                    raise InvalidMultipartContent(str(e))
+                await self.handle_events()
+
+            parser.finalize()
+            await self.handle_events()
+
+            if not self._finished:
+                raise InvalidMultipartContent("Unexpected end of body")
+        except BaseException:
+            await self.discard()
+            raise
+
+        return self.parts
+
+    async def handle_events(self) -> None:
+        events, self._events = self._events, []
+
+        for event, data in events:
+            match event:
+                case "headers":
+                    await self.begin_part(data)
+                case "data":
+                    await self.write_part(data)
+                case "end":
+                    await self.end_part()
+
+    async def begin_part(self, content_disposition: bytes) -> None:
+        _, options = parse_options_header(content_disposition)
+        name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+
+        if filename is None:
+            self._field_name = name
+            self._field_data = bytearray()
+            return
+
+        if name != "files":
+            raise InvalidMultipartContent(f"Unexpected file field {name}")
+
+        self._filename = filename.decode("utf-8")
+        self.file_count += 1
+        try:
+            self.validate_extension(Path(self._filename).suffix)
+        except FiletypeNotAllowed as e:
+            if self.atomic:
+                raise
+            self.skip_part(e)
+            return
+
+        path = await self.storage.get_path(self._filename, self.user_id)
+        self._writer = await self.storage.open_writer(path)
+
+    async def write_part(self, data: bytes) -> None:
+        if self._skipping:
+            return
+
+        if self._writer is not None:
+            size_bytes = self._writer.size_bytes + len(data)
+            if size_bytes > self.config.max_file_size:
+                e = FileTooLarge(self.config.max_file_size, size_bytes)
+                if self.atomic:
+                    raise e
+                writer, self._writer = self._writer, None
+                await writer.abort()
+                self.skip_part(e)
+                return
+
+            await self._writer.write(data)
+        elif self._field_name is not None:
+            if len(self._field_data) + len(data) > MAX_FIELD_SIZE:
+                raise InvalidMultipartContent(f"Field {self._field_name} too large")
+
+            self._field_data += data
+
+    async def end_part(self) -> None:
+        if self._skipping:
+            self._skipping = False
+        elif self._writer is not None:
+            writer, self._writer = self._writer, None
+            self.parts.append(
+                UploadedPart(
+                    self.file_count - 1,
+                    self._filename,
+                    await writer.commit(),
+                    writer.size_bytes,
+                    writer.sha256,
+                )
+            )
+        elif self._field_name is not None:
+            self.fields[self._field_name] = self._field_data.decode("utf-8")
+            self._field_name = None
+
+    def skip_part(self, error: Exception) -> None:
+        """
+        Ignore the rest of the current file.
+        """
+        self.errors[self.file_count - 1] = error
+        self._skipping = True
+
+    async def discard(self) -> None:
+        """
+        Remove everything written so far.
+        """
+        if self._writer is not None:
+            await self._writer.abort()
+            self._writer = None
+
+        for part in self.parts:
+            await self.storage.delete(part.path)
+        self.parts = []